@@ -1,7 +1,7 @@
 # agents/analyst_agent.py
 import os
-from groq import Groq
 from utils.logging import logger
+from utils.llm import get_llm_gateway
 from dotenv import load_dotenv
 from textwrap import dedent
 
@@ -19,7 +19,7 @@ class AnalystAgent:
     """
 
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.llm = get_llm_gateway()
         self.description = "AnalystAgent: Deep integration and financial analysis."
         self.instructions = dedent("""
             Responsibilities:
@@ -40,11 +40,22 @@ class AnalystAgent:
                 - Recommendations for risk mitigation and opportunity exploitation
             6. Include textual descriptions for potential charts or dashboards.
         """)
+        self.merge_instructions = dedent("""
+            You receive one analysis per ticker, produced separately.
+            Combine them into a portfolio-level view:
+            1. Rank the tickers by risk-adjusted attractiveness, with one line of reasoning each.
+            2. Compare valuation, growth and momentum across the tickers.
+            3. Highlight concentration: shared sector, factor or macro exposures.
+            4. Flag conflicts or gaps between the individual analyses.
+            Do not repeat the individual analyses; refer to tickers by symbol.
+        """)
 
-    def analyze(self, market_data: str, research_summary: str) -> str:
-        logger.info("AnalystAgent: Integrating market and research data")
+    def analyze(self, market_data: str, research_summary: str, on_token=None, fresh=False, symbol=None) -> str:
+        """Analyse all symbols at once, or only `symbol` when given per-symbol inputs."""
+        logger.info("AnalystAgent: Integrating market and research data" + (f" for {symbol}" if symbol else ""))
+        scope = f"\nTicker: {symbol}\n" if symbol else ""
         prompt = f"""{self.description}
-
+{scope}
 Instructions:
 {self.instructions}
 
@@ -56,12 +67,44 @@ Research Summary:
 """
 
         try:
-            response = self.client.chat.completions.create(
+            content = self.llm.complete(
+                agent="AnalystAgent",
                 model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                on_token=on_token,
+                use_cache=not fresh,
             )
             logger.info("AnalystAgent: Analysis complete")
-            return response.choices[0].message.content
+            return content
         except Exception as e:
             logger.error(f"AnalystAgent: Analysis failed — {e}")
-            return "Error: Unable to perform analysis at this time."
\ No newline at end of file
+            return "Error: Unable to perform analysis at this time."
+
+    def merge(self, analyses: dict, on_token=None, fresh=False) -> str:
+        """
+        Portfolio-level synthesis of per-symbol analyses ({symbol: analysis}).
+        """
+        logger.info(f"AnalystAgent: Merging analyses for {', '.join(analyses)}")
+        sections = "\n\n".join(f"## {sym}\n{text}" for sym, text in analyses.items())
+        prompt = f"""{self.description}
+
+Instructions:
+{self.merge_instructions}
+
+Per-ticker analyses:
+{sections}
+"""
+
+        try:
+            content = self.llm.complete(
+                agent="AnalystAgent",
+                model="llama-3.3-70b-versatile",
+                messages=[{"role": "user", "content": prompt}],
+                on_token=on_token,
+                use_cache=not fresh,
+            )
+            logger.info("AnalystAgent: Portfolio merge complete")
+            return content
+        except Exception as e:
+            logger.error(f"AnalystAgent: Portfolio merge failed — {e}")
+            return "Error: Unable to merge analyses at this time."
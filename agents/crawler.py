@@ -1,61 +1,512 @@
 # agents/crawler_agent.py
-from utils.utils import fetch_yahoo_finance , alpha_vantage_api_call, finnhub_api_call, fetch_google_finance
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.utils import fetch_yahoo_finance , fetch_yahoo_finance_batch, alpha_vantage_api_call, finnhub_api_call, fetch_google_finance
+from utils.utils import SymbolNotFound
 from utils.logging import logger
-import yfinance as yf
+from utils.cache import get_market_data_cache, MemoryCache
+from utils.single_flight import get_single_flight
+
+
+# Max simultaneous in-flight calls per upstream source
+DEFAULT_SOURCE_LIMITS = {
+    "yahoo": 4,
+    "alpha_vantage": 2,
+    "finnhub": 4,
+    "google_finance": 4,
+}
+
+# Human readable names used in log messages
+SOURCE_NAMES = {
+    "yahoo": "Yahoo Finance",
+    "alpha_vantage": "Alpha Vantage",
+    "finnhub": "Finnhub",
+    "google_finance": "Google Finance",
+}
+
+# Quote-type sources and the field holding their latest price. For these a
+# single valid answer is enough unless the crawl asks for every source.
+QUOTE_PRICE_FIELDS = {
+    "yahoo": "close",
+    "finnhub": "c",
+    "google_finance": "close",
+}
+
+# "all": wait for every source (cross-source validation)
+# "hedge": try quote sources fastest first, start the next one when the
+#          current one runs past its latency percentile or fails
+# "race": start every quote source at once
+# The first two keep the first valid quote per symbol.
+QUOTE_POLICIES = ("all", "hedge", "race")
+
+LATENCY_WINDOW = 128      # upstream latency samples kept per source
+MIN_LATENCY_SAMPLES = 5   # below this, the default hedge delay is used
+
+
+def _valid_quote(source, data):
+    try:
+        return bool(data) and float(data[QUOTE_PRICE_FIELDS[source]]) > 0
+    except (KeyError, TypeError, ValueError):
+        return False
 
 
 class Crawler:
     """
     Fetches market and financial data from multiple sources:
     Yahoo Finance, Alpha Vantage, Finnhub, and Google Finance (fallback).
+
+    Symbols and sources are fetched concurrently, on one small thread pool
+    per source (source_limits workers each), so a paced or slow provider
+    (Alpha Vantage waiting on its quota) only queues its own calls and never
+    holds the threads the other sources need:
+    - max_workers caps the total number of in-flight upstream calls
+    - source_limits caps in-flight calls per source
+    - deadline (seconds) bounds the wall-clock time of a whole crawl
+    Set max_workers=1 to crawl sequentially.
+
+    Results are served from a MarketDataCache (per-source TTL) when fresh,
+    and identical in-flight fetches are coalesced process-wide.
+    When more than one symbol is requested, Yahoo quotes for the whole list
+    are fetched with a single multi-ticker request.
+    Alpha Vantage daily bars are kept in the local OHLCV store: only the
+    days missing since the last stored bar are fetched (nothing when already
+    current), and the crawl result points at the store instead of carrying
+    the JSON. Requests use outputsize=compact (latest 100 bars), so free keys
+    grow the history one delta at a time; "full" (premium only) is used for
+    new or long-stale symbols when alpha_full_history is set.
+
+    quote_policy (see QUOTE_POLICIES) decides how the quote-type sources
+    (Yahoo, Finnhub, Google Finance) are used: "all" waits for every one of
+    them, "hedge" and "race" keep the first valid price per symbol so one
+    slow provider does not set the crawl time. Hedged requests go out once
+    the running source exceeds its hedge_percentile of observed latency
+    (hedge_delay seconds until enough samples are collected).
+
+    Symbols a provider definitely does not know (SymbolNotFound) are noted
+    in `not_found` ({symbol: reason}, kept for an hour), so callers can tell
+    them apart from transient failures such as timeouts or throttling.
     """
-    def __init__(self, alpha_key=None, finnhub_key=None):
+    def __init__(self, alpha_key=None, finnhub_key=None, max_workers=8, source_limits=None, deadline=60,
+                 cache=None, quote_policy="all", hedge_percentile=90, hedge_delay=0.75,
+                 alpha_full_history=False):
+        if quote_policy not in QUOTE_POLICIES:
+            raise ValueError(f"Unknown quote policy '{quote_policy}', expected one of {QUOTE_POLICIES}")
         self.alpha_key = alpha_key
         self.finnhub_key = finnhub_key
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.alpha_full_history = alpha_full_history
+        self.source_limits = {**DEFAULT_SOURCE_LIMITS, **(source_limits or {})}
+        self._source_slots = {
+            source: threading.BoundedSemaphore(limit)
+            for source, limit in self.source_limits.items()
+        }
+        self.cache = cache if cache is not None else get_market_data_cache()
+        self.single_flight = get_single_flight()
+        self._upstream_slots = threading.BoundedSemaphore(max(1, max_workers))
+        self._executors = {}
+        self._executor_lock = threading.Lock()
+        self.quote_policy = quote_policy
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self._latencies = {}
+        self._latency_lock = threading.Lock()
+        self.not_found = MemoryCache(max_entries=4096, default_ttl=3600)
+
+    def _get_executor(self, source):
+        # One pool per source and crawler, so the limits hold across concurrent crawls
+        with self._executor_lock:
+            if source not in self._executors:
+                self._executors[source] = ThreadPoolExecutor(
+                    max_workers=self.source_limits[source], thread_name_prefix=f"crawler-{source}"
+                )
+            return self._executors[source]
+
+    def _submit(self, source, func, *args):
+        """Queue func on the source's own pool (admission per source happens here)."""
+        return self._get_executor(source).submit(func, *args)
+
+    def _sources(self, alpha_key=None, finnhub_key=None, include_history=True):
+        """
+        Return the (source, function, fetcher) triples enabled for the API keys:
+        the per-call keys when given, else the crawler's own.
+        include_history=False leaves out the Alpha Vantage daily history.
+        """
+        alpha_key = alpha_key or self.alpha_key
+        finnhub_key = finnhub_key or self.finnhub_key
+        sources = [("yahoo", "history_1d", fetch_yahoo_finance)]
+        if alpha_key and include_history:
+            sources.append(("alpha_vantage", "ohlcv_store", lambda sym: self._alpha_vantage_history(alpha_key, sym)))
+        if finnhub_key:
+            sources.append(("finnhub", "quote", lambda sym: finnhub_api_call(finnhub_key, sym)))
+        # Google Finance (fallback)
+        sources.append(("google_finance", "quote", fetch_google_finance))
+        return sources
+
+    def _alpha_vantage_history(self, api_key, sym):
+        """Bring the stored daily bars for sym up to date; returns the store summary."""
+        from utils.ohlcv_store import get_ohlcv_store, latest_session, missing_sessions, COMPACT_BARS
+        from utils.normalize import alpha_vantage_arrays
+        import numpy as np
+
+        store = get_ohlcv_store()
+        today = np.datetime64("today", "D")
+        last = store.last_date(sym)
+        # A bar dated today may be a partial intraday bar, so it never counts as current
+        if last is not None and latest_session(today) <= last < today:
+            logger.info(f"OHLCV store already current for {sym} (last bar {last})")
+            return store.summary(sym)
+
+        gap = missing_sessions(last) if last is not None else None
+        covered = gap is not None and gap < COMPACT_BARS
+        outputsize = "full" if self.alpha_full_history and not covered else "compact"
+        dates, ohlcv = alpha_vantage_arrays(alpha_vantage_api_call(api_key, sym, outputsize=outputsize))
+        if dates is None:
+            # Serve what is stored (possibly stale) rather than nothing
+            return store.summary(sym)
+        # Today's session is still open: keep only finished bars in the store
+        final = dates < today
+        dates, ohlcv = dates[final], {field: values[final] for field, values in ohlcv.items()}
+        # A compact fetch that cannot reach the stored bars would leave a hole: start over
+        added = store.append(sym, dates, ohlcv, replace=last is not None and not covered)
+        logger.info(f"OHLCV store: {sym} +{added} bars (Alpha Vantage {outputsize})")
+        return store.summary(sym)
+
+    def _fetch(self, source, function, fetcher, sym):
+        cached = self.cache.get(source, sym, function)
+        if cached is not None:
+            logger.info(f"Cache hit for {SOURCE_NAMES[source]} {sym}")
+            return cached
+
+        # Callers asking for the same (source, function, symbol) share one upstream call
+        key = (source, function, sym.upper())
+        return self.single_flight.do(key, lambda: self._fetch_upstream(source, function, fetcher, sym))
 
-    def crawl(self, symbols):
+    def _fetch_upstream(self, source, function, fetcher, sym):
+        with self._source_slots[source], self._upstream_slots:
+            started = time.monotonic()
+            try:
+                data = fetcher(sym)
+                if data:
+                    self.cache.set(source, sym, function, data)
+                    logger.info(f"Crawled {SOURCE_NAMES[source]} for {sym}")
+                return data
+            except SymbolNotFound as e:
+                self.not_found.set(sym.upper(), f"{SOURCE_NAMES[source]}: {e}")
+                logger.warning(f"{SOURCE_NAMES[source]} does not know {sym}: {e}")
+                return None
+            except Exception as e:
+                logger.warning(f"{SOURCE_NAMES[source]} failed for {sym}: {e}")
+                return None
+            finally:
+                self._record_latency(source, time.monotonic() - started)
+
+    def _record_latency(self, source, seconds):
+        with self._latency_lock:
+            self._latencies.setdefault(source, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def latency_percentile(self, source, percentile):
+        """Observed upstream latency percentile of a source in seconds, None until enough samples."""
+        with self._latency_lock:
+            samples = sorted(self._latencies.get(source, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def _hedge_after(self, source):
+        observed = self.latency_percentile(source, self.hedge_percentile)
+        return self.hedge_delay if observed is None else observed
+
+    def _quote_order(self, quote_sources):
+        """Quote sources fastest first by median latency; unmeasured ones keep their configured order."""
+        def expected(item):
+            index, (source, _, _) = item
+            median = self.latency_percentile(source, 50)
+            return (self.hedge_delay if median is None else median, index)
+        return [source for _, source in sorted(enumerate(quote_sources), key=expected)]
+
+    def _cached_quote(self, sym, quote_sources):
+        for source, function, _ in quote_sources:
+            data = self.cache.get(source, sym, function)
+            if _valid_quote(source, data):
+                logger.info(f"Cache hit for {SOURCE_NAMES[source]} {sym}")
+                return source, data
+        return None
+
+    def _yahoo_batch(self, symbols):
+        """Fetch Yahoo quotes for all symbols in one request, reusing cached entries."""
+        results, missing = {}, []
+        for sym in symbols:
+            cached = self.cache.get("yahoo", sym, "history_1d")
+            if cached is not None:
+                results[sym] = cached
+            else:
+                missing.append(sym)
+
+        if missing:
+            with self._source_slots["yahoo"], self._upstream_slots:
+                started = time.monotonic()
+                fetched = fetch_yahoo_finance_batch(missing)
+                self._record_latency("yahoo_batch", time.monotonic() - started)
+            for sym, data in fetched.items():
+                self.cache.set("yahoo", sym, "history_1d", data)
+                results[sym] = data
+            logger.info(f"Crawled Yahoo Finance for {len(fetched)}/{len(missing)} symbols in one batch")
+
+        return results
+
+    def crawl_history(self, symbols, alpha_key=None):
+        """
+        Return {symbol: {"alpha_vantage": store summary}} for symbols (an empty
+        dict for symbols without history or without an Alpha Vantage key).
+        Complements a crawl made with include_history=False.
+        """
+        history = [triple for triple in self._sources(alpha_key) if triple[0] == "alpha_vantage"]
+        if not history:
+            return {sym: {} for sym in symbols}
+        source, function, fetcher = history[0]
+        started = time.monotonic()
+        futures = {sym: self._submit(source, self._fetch, source, function, fetcher, sym) for sym in symbols}
+        done, pending = wait(list(futures.values()), timeout=self.deadline)
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.warning(
+                f"Crawl deadline of {self.deadline}s reached, dropped {len(pending)} pending history fetches"
+            )
         all_data = {}
+        for sym, future in futures.items():
+            data = future.result() if future in done else None
+            all_data[sym] = {source: data} if data else {}
+        logger.info(f"Crawled history for {len(symbols)} symbols in {time.monotonic() - started:.2f}s")
+        return all_data
+
+    def crawl(self, symbols, quote_policy=None, alpha_key=None, finnhub_key=None, include_history=True):
+        """
+        Return {symbol: {source: data}}. quote_policy overrides the crawler's
+        default for this call, e.g. "all" when every quote source is needed
+        to cross-check prices. alpha_key / finnhub_key apply to this call only;
+        the crawler is shared, so its own keys are never replaced.
+        include_history=False skips the Alpha Vantage daily history (quotes
+        only), e.g. for a universe that is screened first; fetch the history
+        of the shortlist with crawl_history().
+        """
+        policy = quote_policy or self.quote_policy
+        if policy not in QUOTE_POLICIES:
+            raise ValueError(f"Unknown quote policy '{policy}', expected one of {QUOTE_POLICIES}")
+        sources = self._sources(alpha_key, finnhub_key, include_history=include_history)
+        if self.max_workers <= 1:
+            return self._crawl_sequential(symbols, sources, first_quote=policy != "all")
+        if policy != "all":
+            return self._crawl_first_quote(symbols, sources, race=policy == "race")
+
+        started = time.monotonic()
+        batch_yahoo = len(symbols) > 1
 
+        # Fan out every (symbol, source) pair at once; Yahoo goes as one batch
+        futures = {
+            (sym, source): self._submit(source, self._fetch, source, function, fetcher, sym)
+            for sym in symbols
+            for source, function, fetcher in sources
+            if not (batch_yahoo and source == "yahoo")
+        }
+        waiting = list(futures.values())
+        yahoo_future = None
+        if batch_yahoo:
+            yahoo_future = self._submit("yahoo", self._yahoo_batch, symbols)
+            waiting.append(yahoo_future)
+
+        done, pending = wait(waiting, timeout=self.deadline)
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.warning(
+                f"Crawl deadline of {self.deadline}s reached, dropped {len(pending)} pending fetches"
+            )
+        yahoo_results = yahoo_future.result() if yahoo_future in done else {}
+
+        all_data = {}
         for sym in symbols:
             symbol_data = {}
+            for source, _, _ in sources:
+                if batch_yahoo and source == "yahoo":
+                    data = yahoo_results.get(sym)
+                else:
+                    future = futures[(sym, source)]
+                    data = future.result() if future in done else None
+                if data:
+                    symbol_data[source] = data
 
-            # 1️⃣ Yahoo Finance
-            try:
-                yahoo_data = fetch_yahoo_finance(sym)
-                if yahoo_data:
-                    symbol_data["yahoo"] = yahoo_data
-                    logger.info(f"Crawled Yahoo Finance for {sym}")
-            except Exception as e:
-                logger.warning(f"Yahoo Finance failed for {sym}: {e}")
-
-            # 2️⃣ Alpha Vantage
-            if self.alpha_key:
-                try:
-                    av_data = alpha_vantage_api_call(self.alpha_key, sym)
-                    if av_data:
-                        symbol_data["alpha_vantage"] = av_data
-                        logger.info(f"Crawled Alpha Vantage for {sym}")
-                except Exception as e:
-                    logger.warning(f"Alpha Vantage failed for {sym}: {e}")
-
-            # 3️⃣ Finnhub
-            if self.finnhub_key:
-                try:
-                    fh_data = finnhub_api_call(self.finnhub_key, sym)
-                    if fh_data:
-                        symbol_data["finnhub"] = fh_data
-                        logger.info(f"Crawled Finnhub for {sym}")
-                except Exception as e:
-                    logger.warning(f"Finnhub failed for {sym}: {e}")
-
-            # 4️⃣ Google Finance (fallback)
-            try:
-                gf_data = fetch_google_finance(sym)
-                if gf_data:
-                    symbol_data["google_finance"] = gf_data
-                    logger.info(f"Crawled Google Finance for {sym}")
-            except Exception as e:
-                logger.warning(f"Google Finance failed for {sym}: {e}")
+            if not symbol_data:
+                logger.error(f"No market data found for {sym}. Symbol may be delisted or unavailable.")
+
+            all_data[sym] = symbol_data
+
+        logger.info(f"Crawled {len(symbols)} symbols in {time.monotonic() - started:.2f}s")
+        return all_data
+
+    def _crawl_first_quote(self, symbols, sources, race=False):
+        """
+        Concurrent crawl keeping the first valid quote per symbol. Quote
+        sources are started fastest first; with race=True all of them start
+        at once, otherwise the next one starts when the running source fails
+        or passes its hedge delay. Once a symbol has a price, its losing
+        fetches are cancelled if still queued, or left to finish into the
+        cache. Non-quote sources (Alpha Vantage history) are always fetched.
+        With more than one symbol the Yahoo leg is a single multi-ticker
+        request (_yahoo_batch) started first for every symbol; the other
+        quote sources hedge it per symbol.
+        """
+        quote_sources = self._quote_order([s for s in sources if s[0] in QUOTE_PRICE_FIELDS])
+        started = time.monotonic()
+        deadline = started + self.deadline
+
+        quotes = {}        # sym -> (source, data)
+        queued = {}        # sym -> quote sources not started yet
+        running = {}       # future -> (sym, source); sym is None for the Yahoo batch
+        next_hedge = {}    # sym -> time at which the next quote source starts
+        hedged = cancelled = 0
+
+        def launch(sym):
+            source, function, fetcher = queued[sym].pop(0)
+            running[self._submit(source, self._fetch, source, function, fetcher, sym)] = (sym, source)
+            next_hedge[sym] = time.monotonic() + self._hedge_after(source)
+
+        def accept(sym, source, data):
+            nonlocal cancelled
+            quotes[sym] = (source, data)
+            queued[sym] = []
+            for straggler, (other, _) in list(running.items()):
+                if other == sym:
+                    cancelled += straggler.cancel()
+                    del running[straggler]
+
+        missing = []
+        for sym in symbols:
+            cached = self._cached_quote(sym, quote_sources)
+            if cached:
+                quotes[sym] = cached
+            elif quote_sources:
+                missing.append(sym)
+
+        batch_yahoo = len(missing) > 1 and any(source == "yahoo" for source, _, _ in quote_sources)
+        if batch_yahoo:
+            running[self._submit("yahoo", self._yahoo_batch, missing)] = (None, "yahoo")
+            batch_hedge = time.monotonic() + self._hedge_after("yahoo_batch")
+        for sym in missing:
+            if batch_yahoo:
+                queued[sym] = [s for s in quote_sources if s[0] != "yahoo"]
+                next_hedge[sym] = batch_hedge
+            else:
+                queued[sym] = list(quote_sources)
+                launch(sym)
+            while race and queued[sym]:
+                launch(sym)
+
+        futures = {
+            (sym, source): self._submit(source, self._fetch, source, function, fetcher, sym)
+            for sym in symbols
+            for source, function, fetcher in sources
+            if source not in QUOTE_PRICE_FIELDS
+        }
+
+        def unquoted():
+            return [sym for sym in missing if sym not in quotes]
+
+        # Stop as soon as every symbol has a price, even if the Yahoo batch is still out
+        while running and unquoted() and time.monotonic() < deadline:
+            hedging = [sym for sym, rest in queued.items() if rest and sym not in quotes]
+            wake = min([next_hedge[sym] for sym in hedging], default=deadline)
+            done, _ = wait(
+                list(running), timeout=max(0, min(wake, deadline) - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                if future not in running:
+                    continue
+                sym, source = running.pop(future)
+                if sym is None:
+                    batch = future.result() or {}
+                    for sym in missing:
+                        if sym in quotes:
+                            continue
+                        if _valid_quote("yahoo", batch.get(sym)):
+                            accept(sym, "yahoo", batch[sym])
+                        elif queued[sym]:
+                            launch(sym)  # not in the batch: start the next source now
+                    continue
+                data = future.result()
+                if _valid_quote(source, data):
+                    accept(sym, source, data)
+                elif queued[sym]:
+                    launch(sym)  # failed or empty: no point waiting for the hedge delay
+
+            now = time.monotonic()
+            for sym in hedging:
+                if sym not in quotes and queued[sym] and next_hedge[sym] <= now:
+                    launch(sym)
+                    hedged += 1
+
+        for future in running:
+            future.cancel()  # started ones finish into the cache
+        if unquoted():
+            logger.warning(f"Crawl deadline of {self.deadline}s reached waiting for quotes")
+
+        done, pending = wait(list(futures.values()), timeout=max(0, deadline - time.monotonic()))
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.warning(
+                f"Crawl deadline of {self.deadline}s reached, dropped {len(pending)} pending fetches"
+            )
+
+        all_data = {}
+        for sym in symbols:
+            symbol_data = {}
+            if sym in quotes:
+                source, data = quotes[sym]
+                symbol_data[source] = data
+            for source, _, _ in sources:
+                future = futures.get((sym, source))
+                data = future.result() if future in done else None
+                if data:
+                    symbol_data[source] = data
+
+            if not symbol_data:
+                logger.error(f"No market data found for {sym}. Symbol may be delisted or unavailable.")
+
+            all_data[sym] = symbol_data
+
+        winners = {}
+        for source, _ in quotes.values():
+            winners[source] = winners.get(source, 0) + 1
+        logger.info(
+            f"Crawled {len(symbols)} symbols in {time.monotonic() - started:.2f}s "
+            f"(first quote from {winners}, {hedged} hedged, {cancelled} cancelled)"
+        )
+        return all_data
+
+    def _crawl_sequential(self, symbols, sources, first_quote=False):
+        all_data = {}
+        batch_yahoo = len(symbols) > 1
+        yahoo_results = self._yahoo_batch(symbols) if batch_yahoo else {}
+
+        for sym in symbols:
+            symbol_data = {}
+            for source, function, fetcher in sources:
+                # Quote sources act as a fallback chain once one has a valid price
+                if first_quote and source in QUOTE_PRICE_FIELDS and any(
+                    _valid_quote(s, d) for s, d in symbol_data.items() if s in QUOTE_PRICE_FIELDS
+                ):
+                    continue
+                if batch_yahoo and source == "yahoo":
+                    data = yahoo_results.get(sym)
+                else:
+                    data = self._fetch(source, function, fetcher, sym)
+                if data:
+                    symbol_data[source] = data
 
             if not symbol_data:
                 logger.error(f"No market data found for {sym}. Symbol may be delisted or unavailable.")
@@ -1,11 +1,13 @@
 import os
 import sys
 from dotenv import load_dotenv
-from groq import Groq
-import json
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.logging import logger
-from utils.utils import chunk_text, remove_code_blocks  # ✅ import remove_code_blocks
+from utils.utils import chunk_sections, remove_code_blocks, TokenCounter  # ✅ import remove_code_blocks
+from utils.indicators import indicator_table
+from utils.llm import get_llm_gateway
+from utils.normalize import normalize_market_data, serialize_records
 from textwrap import dedent
 
 load_dotenv("/Users/shima/PycharmProjects/finance-agents/app/.env")
@@ -15,21 +17,25 @@ class MarketAgent:
     MarketAgent:
     Handles quantitative market analysis.
     - Processes raw data from Yahoo Finance, Alpha Vantage, Finnhub, etc.
+    - Normalizes each source into compact per-symbol records (utils.normalize),
+      computes technical indicators locally (utils.indicators) and sends
+      the LLM dense CSV-like tables instead of raw JSON.
     - Detects technical and statistical signals.
     - Produces structured outputs for downstream analysis.
     """
 
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.llm = get_llm_gateway()
         self.description = "MarketAgent: Quantitative analysis of market data."
         self.instructions = dedent("""
             Responsibilities:
-            1. Clean and normalize market datasets from Yahoo Finance, Alpha Vantage, and Finnhub.
-            2. Analyze quantitative signals:
-                - Price trends and momentum
-                - Volatility levels
-                - Volume and liquidity patterns
-                - Technical indicators (moving averages, RSI, MACD, etc.)
+            1. Use the provided indicator, quote and recent-bar tables (normalized locally from
+               Yahoo Finance, Alpha Vantage, and Finnhub data). Do not recompute the indicators.
+            2. Interpret quantitative signals:
+                - Price trends and momentum (SMA/EMA, MACD)
+                - Volatility levels and drawdowns
+                - Volume and liquidity patterns (volume z-score)
+                - Overbought / oversold conditions (RSI)
             3. Detect anomalies or unusual activity (e.g., price spikes, trading surges).
             4. Summarize insights in:
                 - Plain language explanation
@@ -37,31 +43,138 @@ class MarketAgent:
                 - Visual descriptions for charts
             5. Identify key tickers or patterns that warrant deeper qualitative research.
         """)
+        self.model = "llama-3.3-70b-versatile"
         self.max_input_tokens = 10000
+        self.recent_bars = 5
+        # Max chunk prompts sent to Groq at the same time
+        self.max_concurrency = int(os.environ.get("MARKET_AGENT_CONCURRENCY", 4))
+        self.reduce_instructions = dedent("""
+            You are given several partial market analyses, each covering a different
+            slice of the same dataset. Merge them into one coherent report:
+            - Keep one section per topic; do not repeat headings or findings.
+            - Keep every ticker-specific number and signal.
+            - Reconcile overlapping conclusions into a single portfolio-level summary.
+            - Keep the structured JSON block and chart descriptions, merged across parts.
+        """)
         self.output_tokens = 2000
 
-    def analyze_market(self, market_data: dict) -> dict:
+    def build_context(self, market_data: dict) -> str:
+        """Summarize crawled data as compact tables for the prompt."""
+        records = normalize_market_data(market_data)
+        sections = []
+        indicators = indicator_table(records)
+        if indicators:
+            sections.append(f"Technical indicators (latest bar, computed locally):\n{indicators}")
+        dense = serialize_records(records, last_bars=self.recent_bars)
+        if dense:
+            sections.append(dense)
+        missing = [sym for sym, data in market_data.items() if not data]
+        if missing:
+            sections.append(f"No market data available for: {', '.join(missing)}")
+        return "\n\n".join(sections)
+
+    def analyze_market(self, market_data: dict, on_token=None, fresh=False) -> dict:
         logger.info("MarketAgent: Cleaning and analyzing market data")
-        # Convert dict to JSON string
-        market_data_str = json.dumps(market_data, indent=2)
+        # Compute indicators locally and keep only the compact tables
+        market_data_str = self.build_context(market_data)
         # Remove any code blocks before sending to LLM
         market_data_str = remove_code_blocks(market_data_str)
 
-        chunks = chunk_text(market_data_str, self.max_input_tokens)
-        full_content = ""
+        # Prompt overhead (description + instructions) counts against the budget
+        counter = TokenCounter(self.model)
+        budget = self.max_input_tokens - counter.count(f"{self.description}\n{self.instructions}")
+        if counter.count(market_data_str) <= budget:
+            chunks = [market_data_str] if market_data_str else []
+        else:
+            # Too large for one call: split on symbol boundaries
+            sections = [
+                remove_code_blocks(self.build_context({sym: data}))
+                for sym, data in market_data.items()
+            ]
+            chunks = chunk_sections(sections, budget, model=self.model)
+
+        # Map: analyze chunks concurrently under the concurrency cap.
+        # Tokens are streamed from the single call or from the reduce step only.
+        map_on_token = on_token if len(chunks) == 1 else None
+        workers = max(1, min(self.max_concurrency, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                lambda item: self._analyze_chunk(item[0], len(chunks), item[1], on_token=map_on_token, fresh=fresh),
+                enumerate(chunks),
+            ))
+
+        partials = [r for r in results if r]
+        errors = [f"[Error processing chunk {i+1}]" for i, r in enumerate(results) if not r]
 
-        for i, chunk in enumerate(chunks):
-            prompt = f"{self.description}\n\nInstructions:\n{self.instructions}\n\nData:\n{chunk}"
-            try:
-                response = self.client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                content = response.choices[0].message.content
-                full_content += content + "\n\n"
-                logger.info(f"MarketAgent: Processed chunk {i+1}/{len(chunks)}")
-            except Exception as e:
-                logger.error(f"MarketAgent: Groq API error on chunk {i+1} — {e}")
-                full_content += f"[Error processing chunk {i+1}]\n\n"
+        # Reduce: merge per-chunk analyses into one summary
+        if len(partials) > 1:
+            full_content = self._reduce(partials, on_token=on_token, fresh=fresh)
+        else:
+            full_content = "\n\n".join(partials)
+        if errors:
+            full_content = "\n\n".join([full_content] + errors)
 
         return {"markdown": full_content.strip()}
+
+    def _analyze_chunk(self, i: int, total: int, chunk: str, on_token=None, fresh=False):
+        prompt = f"{self.description}\n\nInstructions:\n{self.instructions}\n\nData:\n{chunk}"
+        try:
+            content = self.llm.complete(
+                agent="MarketAgent",
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                on_token=on_token,
+                use_cache=not fresh,
+            )
+            logger.info(f"MarketAgent: Processed chunk {i+1}/{total}")
+            return content
+        except Exception as e:
+            logger.error(f"MarketAgent: Groq API error on chunk {i+1} — {e}")
+            return None
+
+    def _reduce(self, partials: list[str], on_token=None, fresh=False) -> str:
+        """
+        Merge partial analyses into one report. When they do not fit in one
+        reduce prompt (max_input_tokens minus the prompt overhead), they are
+        first merged in token-bounded groups, level by level (a reduce tree),
+        until the remaining parts fit. Only the final merge streams tokens.
+        """
+        counter = TokenCounter(self.model)
+        budget = self.max_input_tokens - counter.count(f"{self.description}\n{self.reduce_instructions}")
+        level = 0
+        while len(partials) > 1:
+            labeled = [f"### Part {i+1}\n{p}" for i, p in enumerate(partials)]
+            groups = chunk_sections(labeled, budget, model=self.model)
+            if len(groups) == 1:
+                break
+            if len(groups) >= len(partials):
+                # Merged parts are no smaller than their inputs: stop growing the tree
+                logger.warning(f"MarketAgent: reduce tree made no progress at level {level}, merging anyway")
+                break
+            level += 1
+            workers = max(1, min(self.max_concurrency, len(groups)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                merged = list(pool.map(lambda group: self._merge(group, fresh=fresh), groups))
+            logger.info(f"MarketAgent: reduce level {level} merged {len(partials)} parts into {len(merged)}")
+            partials = merged
+        if len(partials) == 1:
+            return partials[0]
+        parts = "\n\n".join(f"### Part {i+1}\n{p}" for i, p in enumerate(partials))
+        return self._merge(parts, on_token=on_token, fresh=fresh)
+
+    def _merge(self, parts: str, on_token=None, fresh=False) -> str:
+        """One reduce call over already labeled parts."""
+        prompt = f"{self.description}\n\nInstructions:\n{self.reduce_instructions}\n\nPartial analyses:\n{parts}"
+        try:
+            content = self.llm.complete(
+                agent="MarketAgent",
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                on_token=on_token,
+                use_cache=not fresh,
+            )
+            logger.info(f"MarketAgent: Merged {parts.count('### Part ')} partial analyses")
+            return content
+        except Exception as e:
+            logger.error(f"MarketAgent: Reduce step failed, returning concatenated parts — {e}")
+            return parts
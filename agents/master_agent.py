@@ -1,13 +1,12 @@
 import os
-from agents.crawler import Crawler
-from agents.market_agent import MarketAgent
-from agents.research_agent import ResearchAgent
-from agents.analyst_agent import AnalystAgent
-from agents.recommender_agent import RecommenderAgent
-from agents.resolver_agent import ResolverAgent
+from agents.registry import get_agent
 from dotenv import load_dotenv
 from utils.logging import logger
+from utils.pipeline import PipelineGraph, Stage, StageError, run_sync, run_blocking
+from utils.cache import get_symbol_result_cache
+from utils.symbol_gate import get_symbol_validator
 from textwrap import dedent
+import asyncio
 import json 
 
 
@@ -16,6 +15,26 @@ import json
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.abspath(os.path.join(BASE_DIR, "../app",".env")))
 
+# Per-stage timeout (seconds per attempt) and retry policy
+STAGE_POLICIES = {
+    "crawl": {"timeout": 90, "retries": 0},
+    "screen": {"timeout": 30, "retries": 0},
+    "history": {"timeout": 90, "retries": 0},
+    "market": {"timeout": 180, "retries": 1},
+    "research": {"timeout": 180, "retries": 1},
+    "analyst": {"timeout": 180, "retries": 1},
+    "portfolio": {"timeout": 180, "retries": 1},
+    "recommend": {"timeout": 180, "retries": 1},
+}
+
+# Daily history downloaded (in one request) to screen large universes
+SCREEN_HISTORY_PERIOD = "1y"
+
+
+def is_error_output(value) -> bool:
+    """Agents catch their own exceptions and return error text instead; spot it."""
+    return isinstance(value, str) and (value.startswith("Error:") or "[Error processing chunk" in value)
+
 
 class MasterAgent:
     """
@@ -23,6 +42,8 @@ class MasterAgent:
     - Resolves user queries into ticker symbols (via ResolverAgent)
     - Crawls raw data from multiple sources
     - Runs market, research, analyst, and recommender agents
+    Sub-agents come from the process-wide registry and are only built
+    (and their dependencies imported) the first time a stage needs them.
     """
 
     def __init__(self):
@@ -30,25 +51,57 @@ class MasterAgent:
         self.alpha_key = os.environ.get("ALPHA_VANTAGE_KEY")
         self.finnhub_key = os.environ.get("FINNHUB_KEY")
 
-        # Initialize agents
-        self.resolver = ResolverAgent()
-        self.crawler = Crawler(alpha_key=self.alpha_key, finnhub_key=self.finnhub_key)
-        self.market = MarketAgent()
-        self.research = ResearchAgent()
-        self.analyst = AnalystAgent()
-        self.recommender = RecommenderAgent()
+        # Per-symbol mode: research and analysis run once per ticker and are
+        # merged at portfolio level; set PIPELINE_PER_SYMBOL=0 for one combined analysis
+        self.per_symbol = os.environ.get("PIPELINE_PER_SYMBOL", "1") == "1"
+        self.symbol_results = get_symbol_result_cache()
+        self.validator = get_symbol_validator()
+        # Larger universes are pre-screened and only the top N reach the LLM agents (0 = off)
+        self.top_n = int(os.environ.get("PIPELINE_TOP_N", 8))
+
+    @property
+    def resolver(self):
+        return get_agent("resolver")
+
+    @property
+    def crawler(self):
+        return get_agent("crawler")
+
+    @property
+    def market(self):
+        return get_agent("market")
+
+    @property
+    def research(self):
+        return get_agent("research")
+
+    @property
+    def analyst(self):
+        return get_agent("analyst")
 
-    def resolve_and_execute(self, user_query: str, alpha_key=None, finnhub_key=None) -> str:
+    @property
+    def recommender(self):
+        return get_agent("recommender")
+
+    def resolve_and_execute(self, user_query: str, alpha_key=None, finnhub_key=None, on_event=None,
+                            cancel_event=None, fresh=False, incremental=False) -> str:
         """
         Full pipeline starting from a natural language user query.
         Always resolves query -> symbols, then runs pipeline.
         Always returns a JSON string.
+        on_event / cancel_event are passed to the stage graph (see PipelineGraph);
+        fresh=True bypasses the LLM response cache; incremental=True only
+        re-analyses symbols whose data changed (see build_pipeline).
         """
         logger.info(f"MasterAgent: Resolving query -> {user_query}")
 
         # Step 0: Resolve query into ticker symbols
+        if on_event:
+            on_event("resolve", "started", None)
         symbols = self.resolver.resolve(user_query)
         logger.info(f"MasterAgent: Resolved symbols -> {symbols}")
+        if on_event:
+            on_event("resolve", "completed", symbols)
 
         if not symbols:
             logger.error(f"MasterAgent: No symbols found for query: {user_query}")
@@ -58,53 +111,290 @@ class MasterAgent:
             )
 
         # Step 1+: Continue full pipeline
-        result = self.execute_pipeline(symbols, alpha_key=alpha_key, finnhub_key=finnhub_key)
+        try:
+            result = self.execute_pipeline(symbols, alpha_key=alpha_key, finnhub_key=finnhub_key,
+                                           on_event=on_event, cancel_event=cancel_event, fresh=fresh,
+                                           incremental=incremental)
+        except StageError as e:
+            return json.dumps({"error": str(e), "symbols": symbols}, indent=2)
 
         # Always return as pretty JSON string
         return json.dumps(result, indent=2)
 
-    def execute_pipeline(self, symbols, alpha_key=None, finnhub_key=None) -> dict:
+    def execute_pipeline(self, symbols, alpha_key=None, finnhub_key=None, on_event=None,
+                         cancel_event=None, fresh=False, incremental=False) -> dict:
         """
-        Orchestrates the full multi-agent pipeline:
-        1. Crawl raw data from multiple sources
-        2. Market analysis
-        3. Research analysis
-        4. Analyst deep dive
-        5. Recommendations
+        Orchestrates the full multi-agent pipeline (see execute_pipeline_async).
+        Safe to call from sync code and from inside a running event loop.
         """
-        # Override API keys if provided at runtime
-        if alpha_key:
-            self.crawler.alpha_key = alpha_key
-        if finnhub_key:
-            self.crawler.finnhub_key = finnhub_key
+        return run_sync(self.execute_pipeline_async(
+            symbols, alpha_key=alpha_key, finnhub_key=finnhub_key, on_event=on_event,
+            cancel_event=cancel_event, fresh=fresh, incremental=incremental,
+        ))
 
-        logger.info(f"MasterAgent: Starting pipeline for symbols: {symbols}")
+    def build_pipeline(self, symbols, on_event=None, cancel_event=None, fresh=False, incremental=False,
+                       reused=None, alpha_key=None, finnhub_key=None) -> PipelineGraph:
+        """
+        Stage graph of the pipeline:
+        crawl -> [screen -> history] -> market (per symbol) --+
+        research (per symbol) --------------------------------+-> analyst -> [portfolio] -> recommend
+        Research only needs the resolved symbols, so it runs alongside
+        crawling and market analysis.
+        When more than top_n symbols are resolved, the screen stage ranks the
+        whole universe with vectorized metrics (utils.screening) and only the
+        top_n go on to the LLM stages (research then waits for it); the rest
+        appear in the screening table passed to the recommender. Screening
+        history for the whole universe comes from one Yahoo request, since
+        Alpha Vantage quotas only cover a few symbols per crawl: the universe
+        crawl skips Alpha Vantage, and the history stage fetches it for the
+        top_n only.
+        In per-symbol mode the analyst runs once per ticker and the portfolio
+        stage merges the per-ticker analyses; otherwise one combined analyst
+        call feeds the recommender directly.
+        Per-symbol research and analyst outputs are cached by (stage, symbol,
+        input digest), so overlapping queries reuse them; fresh=True skips
+        the cache lookups.
+        incremental=True also caches market analysis per symbol under a
+        fingerprint of its normalized crawl data: only symbols whose numbers
+        moved (or whose outputs expired) go back to the LLM, and the analyst
+        cache follows since its inputs are unchanged. The portfolio and
+        recommend stages always run. Reused symbols are recorded per stage in
+        `reused` ({stage: [symbols]}) when given.
+        Agent error text fails the stage (so its retries apply); a retried
+        per-symbol stage only redoes the symbols that failed.
+        When on_event is set, streamed LLM text is forwarded as
+        on_event(stage, "token", {"symbol": ..., "text": ...}).
+        alpha_key / finnhub_key are request keys used by this run's crawl only.
+        """
+        screening = 0 < self.top_n < len(symbols)
+        analysed_count = self.top_n if screening else len(symbols)
+        per_symbol = self.per_symbol and analysed_count > 1
+        outputs = {"market": {}, "research": {}, "analyst": {}}  # per-symbol text of this run
+        universe = {"selected": list(symbols), "table": None}  # narrowed by the screen stage
+
+        def tokens(stage, symbol=None):
+            if on_event is None:
+                return None
+            return lambda text: on_event(stage, "token", {"symbol": symbol, "text": text})
+
+        def cached(stage, symbol, inputs, compute):
+            """Per-symbol stage output from the result cache, or compute() and store it."""
+            digest = self.symbol_results.digest(*inputs)
+            if not fresh:
+                hit = self.symbol_results.get(stage, symbol, digest)
+                if hit is not None:
+                    logger.info(f"MasterAgent: reusing cached {stage} result for {symbol}")
+                    if reused is not None:
+                        reused.setdefault(stage, []).append(symbol)
+                    emit = tokens(stage, symbol)
+                    if emit is not None:
+                        emit(hit)
+                    return hit
+            value = compute()
+            if value and not is_error_output(value):
+                self.symbol_results.set(stage, symbol, digest, value)
+            return value
+
+        def joined(stage):
+            return "\n\n".join(f"## {sym}\n{outputs[stage][sym]}" for sym in universe["selected"])
 
-        # 1. symbols to crawler 
-        raw_data = self.crawler.crawl(symbols)
-        logger.info("MasterAgent: Crawling complete")
+        def with_screening(analysis):
+            if not universe["table"]:
+                return analysis
+            return f"{analysis}\n\n# Screened universe (not analysed in depth)\n{universe['table']}"
 
-        # 2. Market analysis
-        market_summary = self.market.analyze_market(raw_data)
-        logger.info("MasterAgent: Market analysis complete")
+        def crawl(results):
+            # A universe to screen gets quotes only; history follows for the shortlist
+            data = self.crawler.crawl(symbols, alpha_key=alpha_key, finnhub_key=finnhub_key,
+                                      include_history=not screening)
+            empty = [sym for sym, sources in data.items() if not sources]
+            unknown = [sym for sym in empty if self.crawler.not_found.get(sym.upper())]
+            self.validator.mark_invalid(unknown)
+            # No definite signal (deadline, throttling, ...): skip the symbol only
+            # briefly, and only when the sources answered for the others
+            maybe = [sym for sym in empty if sym not in unknown]
+            if maybe and len(empty) < len(data):
+                self.validator.mark_invalid(maybe, definite=False)
+            return data
 
-        # 3. Research analysis
-        research_summary = self.research.analyze(market_summary)
-        logger.info("MasterAgent: Research analysis complete")
+        def screen(results):
+            from utils.normalize import normalize_market_data, SymbolRecord
+            from utils.screening import screen as rank, to_markdown
+            from utils.utils import fetch_yahoo_history_batch
 
-        # 4. Analyst deep dive
-        analysis = self.analyst.analyze(research_summary, market_summary)
-        logger.info("MasterAgent: Analyst deep dive complete")
+            records = normalize_market_data(results["crawl"])
+            history = fetch_yahoo_history_batch(symbols, period=SCREEN_HISTORY_PERIOD)
+            for sym, (dates, ohlcv) in history.items():
+                record = records[sym]
+                if len(dates) > len(record):
+                    records[sym] = SymbolRecord(sym, dates=dates, ohlcv=ohlcv, quotes=record.quotes,
+                                                change_pct=record.change_pct)
+            logger.info(f"MasterAgent: screening history for {len(history)}/{len(symbols)} symbols from Yahoo")
+            ranked = rank(records, self.top_n)
+            universe["selected"], universe["table"] = ranked["selected"], ranked["table"]
+            logger.info(f"MasterAgent: screened {len(symbols)} symbols, analysing {ranked['selected']}")
+            return {
+                "selected": ranked["selected"],
+                "table": ranked["table"],
+                "markdown": f"Top {len(ranked['selected'])} of {len(symbols)} forwarded to analysis: "
+                            f"{', '.join(ranked['selected'])}\n\n{to_markdown(ranked['table'])}",
+            }
 
-        # 5. Recommendations
-        recommendations = self.recommender.recommend(analysis)
-        logger.info("MasterAgent: Recommendations generated")
+        def history(results):
+            # Alpha Vantage history only for the symbols that survived the screen
+            data = self.crawler.crawl_history(universe["selected"], alpha_key=alpha_key)
+            return {sym: {**sources, **data.get(sym, {})} for sym, sources in results["crawl"].items()}
+
+        async def fan_out(stage, func):
+            # One blocking agent call per selected symbol; a retry only redoes failed symbols
+            done = outputs[stage]
+            todo = [sym for sym in universe["selected"] if sym not in done or is_error_output(done[sym])]
+            done.update(zip(todo, await asyncio.gather(*(run_blocking(func, sym) for sym in todo))))
+
+        def any_failed(stage):
+            return lambda value: any(is_error_output(outputs[stage].get(sym)) for sym in universe["selected"])
+
+        async def market(results):
+            raw_data = results["history"] if screening else results["crawl"]
+
+            def analyze(sym):
+                return self.market.analyze_market(
+                    {sym: raw_data[sym]}, on_token=tokens("market", sym), fresh=fresh
+                )["markdown"]
+
+            if incremental:
+                from utils.normalize import normalize_symbol
+
+                def analyze_changed(sym):
+                    fingerprint = normalize_symbol(sym, raw_data[sym] or {}).fingerprint()
+                    return cached("market", sym, ["market", fingerprint], lambda: analyze(sym))
+
+                await fan_out("market", analyze_changed)
+            else:
+                await fan_out("market", analyze)
+            return {"markdown": joined("market")}
+
+        async def research(results):
+            await fan_out("research", lambda sym: cached(
+                "research", sym, ["research", sym],
+                lambda: self.research.analyze_symbols([sym], on_token=tokens("research", sym), fresh=fresh),
+            ))
+            return joined("research")
+
+        async def analyst(results):
+            await fan_out("analyst", lambda sym: cached(
+                "analyst", sym, ["analyst", outputs["market"][sym], outputs["research"][sym]],
+                lambda: self.analyst.analyze(
+                    market_data=outputs["market"][sym], research_summary=outputs["research"][sym],
+                    on_token=tokens("analyst", sym), fresh=fresh, symbol=sym,
+                ),
+            ))
+            return joined("analyst")
+
+        stages = [Stage("crawl", crawl, **STAGE_POLICIES["crawl"])]
+        if screening:
+            stages += [
+                Stage("screen", screen, deps=["crawl"], **STAGE_POLICIES["screen"]),
+                Stage("history", history, deps=["screen"], **STAGE_POLICIES["history"]),
+                Stage("market", market, deps=["history"], failed_if=any_failed("market"),
+                      **STAGE_POLICIES["market"]),
+                Stage("research", research, deps=["screen"], failed_if=any_failed("research"),
+                      **STAGE_POLICIES["research"]),
+            ]
+        else:
+            stages += [
+                Stage("market", market, deps=["crawl"], failed_if=any_failed("market"),
+                      **STAGE_POLICIES["market"]),
+                Stage("research", research, failed_if=any_failed("research"), **STAGE_POLICIES["research"]),
+            ]
+        if per_symbol:
+            stages += [
+                Stage("analyst", analyst, deps=["market", "research"], failed_if=any_failed("analyst"),
+                      **STAGE_POLICIES["analyst"]),
+                Stage(
+                    "portfolio",
+                    lambda r: self.analyst.merge(outputs["analyst"], on_token=tokens("portfolio"), fresh=fresh),
+                    deps=["analyst"],
+                    failed_if=is_error_output,
+                    **STAGE_POLICIES["portfolio"],
+                ),
+                Stage(
+                    "recommend",
+                    lambda r: self.recommender.recommend(
+                        with_screening(
+                            f"# Portfolio overview\n{r['portfolio']}\n\n# Per-ticker analysis\n{r['analyst']}"
+                        ),
+                        on_token=tokens("recommend"), fresh=fresh,
+                    ),
+                    deps=["portfolio"],
+                    failed_if=is_error_output,
+                    **STAGE_POLICIES["recommend"],
+                ),
+            ]
+        else:
+            stages += [
+                Stage(
+                    "analyst",
+                    lambda r: self.analyst.analyze(
+                        market_data=r["market"], research_summary=r["research"], on_token=tokens("analyst"),
+                        fresh=fresh,
+                    ),
+                    deps=["market", "research"],
+                    failed_if=is_error_output,
+                    **STAGE_POLICIES["analyst"],
+                ),
+                Stage(
+                    "recommend",
+                    lambda r: self.recommender.recommend(
+                        with_screening(r["analyst"]), on_token=tokens("recommend"), fresh=fresh
+                    ),
+                    deps=["analyst"],
+                    failed_if=is_error_output,
+                    **STAGE_POLICIES["recommend"],
+                ),
+            ]
+        return PipelineGraph(stages, on_event=on_event, cancel_event=cancel_event)
+
+    async def execute_pipeline_async(self, symbols, alpha_key=None, finnhub_key=None, on_event=None,
+                                     cancel_event=None, fresh=False, incremental=False) -> dict:
+        """
+        Runs the pipeline stage graph:
+        0. Validate symbols (utils.symbol_gate)
+        1. Crawl raw data from multiple sources
+           (large universes: quotes only, pre-screened down to the top N,
+           then daily history for the shortlist)
+        2. Market analysis (per symbol)
+        3. Research analysis (per symbol, concurrent with 1-2)
+        4. Analyst deep dive (per symbol, then merged at portfolio level)
+        5. Recommendations
+        Runtime API keys (alpha_key, finnhub_key) only apply to this run.
+        """
+        # Drop junk and recently dead symbols before any network work (fresh runs retry dead ones)
+        symbols, rejected = self.validator.validate(symbols, skip_negative=fresh)
+        if on_event and rejected:
+            on_event("validate", "completed", {"symbols": symbols, "rejected": rejected})
+        if not symbols:
+            raise StageError("validate", f"no valid symbols (rejected: {', '.join(rejected)})")
+
+        logger.info(f"MasterAgent: Starting pipeline for symbols: {symbols}")
+        reused = {}
+        graph = self.build_pipeline(symbols, on_event=on_event, cancel_event=cancel_event, fresh=fresh,
+                                    incremental=incremental, reused=reused, alpha_key=alpha_key,
+                                    finnhub_key=finnhub_key)
+        results = await graph.run()
+        logger.info("MasterAgent: Pipeline complete")
 
-        return {
+        result = {
             "symbols": symbols,
-            # "raw_data": raw_data,                  
-            "market_summary": market_summary,
-            "research_summary": research_summary,
-            "analysis": analysis,
-            "recommendations": recommendations,
+            "rejected_symbols": rejected,
+            "screening": results.get("screen"),
+            # "raw_data": results["crawl"],
+            "market_summary": results["market"],
+            "research_summary": results["research"],
+            "analysis": results["analyst"],
+            "portfolio": results.get("portfolio"),
+            "recommendations": results["recommend"],
         }
+        if incremental:
+            result["reused"] = reused
+        return result
@@ -2,8 +2,8 @@
 import os 
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from groq import Groq
 from utils.logging import logger
+from utils.llm import get_llm_gateway
 from dotenv import load_dotenv
 from textwrap import dedent
 
@@ -21,7 +21,7 @@ class RecommenderAgent:
     """
 
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.llm = get_llm_gateway()
         self.description = "RecommenderAgent: Generates actionable investment recommendations."
         self.instructions = dedent("""
             Responsibilities:
@@ -36,7 +36,7 @@ class RecommenderAgent:
             4. Explain reasoning in plain language, citing supporting data from analysis.
         """)
 
-    def recommend(self, analysis_results: str) -> str:
+    def recommend(self, analysis_results: str, on_token=None, fresh=False) -> str:
         logger.info("RecommenderAgent: Generating recommendations")
         prompt = f"""{self.description}
 
@@ -48,12 +48,15 @@ Analysis Results:
 """
 
         try:
-            response = self.client.chat.completions.create(
+            content = self.llm.complete(
+                agent="RecommenderAgent",
                 model="qwen/qwen3-32b",
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                on_token=on_token,
+                use_cache=not fresh,
             )
             logger.info("RecommenderAgent: Recommendations generated")
-            return response.choices[0].message.content
+            return content
         except Exception as e:
             logger.error(f"RecommenderAgent: Recommendation failed — {e}")
             return "Error: Unable to generate recommendations at this time."
@@ -0,0 +1,68 @@
+# agents/registry.py
+import os
+import threading
+import importlib
+from utils.logging import logger
+
+
+# Agent name -> (module, class). Modules are imported on first use so that
+# heavy dependencies (LangChain, Gemini, yfinance, pandas, ...) are only
+# loaded by the process when an agent is actually needed.
+AGENT_CLASSES = {
+    "master": ("agents.master_agent", "MasterAgent"),
+    "resolver": ("agents.resolver_agent", "ResolverAgent"),
+    "crawler": ("agents.crawler", "Crawler"),
+    "market": ("agents.market_agent", "MarketAgent"),
+    "research": ("agents.research_agent", "ResearchAgent"),
+    "analyst": ("agents.analyst_agent", "AnalystAgent"),
+    "recommender": ("agents.recommender_agent", "RecommenderAgent"),
+}
+
+_agents = {}
+_locks = {name: threading.Lock() for name in AGENT_CLASSES}
+
+
+def _build(name):
+    module_name, class_name = AGENT_CLASSES[name]
+    cls = getattr(importlib.import_module(module_name), class_name)
+    if name == "crawler":
+        return cls(
+            alpha_key=os.environ.get("ALPHA_VANTAGE_KEY"),
+            finnhub_key=os.environ.get("FINNHUB_KEY"),
+            quote_policy=os.environ.get("CRAWLER_QUOTE_POLICY", "hedge"),
+            hedge_percentile=float(os.environ.get("CRAWLER_HEDGE_PERCENTILE", 90)),
+            # outputsize=full is premium-only on Alpha Vantage
+            alpha_full_history=os.environ.get("ALPHA_VANTAGE_OUTPUTSIZE", "compact") == "full",
+        )
+    return cls()
+
+
+def get_agent(name: str):
+    """
+    Return the process-wide instance of an agent, constructing it (and
+    importing its module) on first use. Agents are built under a per-agent
+    lock, so concurrent first requests share one instance.
+    """
+    if name not in AGENT_CLASSES:
+        raise KeyError(f"Unknown agent '{name}'")
+    agent = _agents.get(name)
+    if agent is not None:
+        return agent
+    with _locks[name]:
+        if name not in _agents:
+            logger.info(f"AgentRegistry: building {name} agent")
+            _agents[name] = _build(name)
+        return _agents[name]
+
+
+def get_master_agent():
+    return get_agent("master")
+
+
+def preload(names=None):
+    """Build agents ahead of the first request (e.g. in a background thread at startup)."""
+    for name in names or AGENT_CLASSES:
+        try:
+            get_agent(name)
+        except Exception as e:
+            logger.warning(f"AgentRegistry: preloading {name} failed — {e}")
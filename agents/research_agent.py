@@ -2,10 +2,10 @@
 import os 
 import sys
 import json
-from groq import Groq
 from textwrap import dedent
 from dotenv import load_dotenv
 from utils.logging import logger
+from utils.llm import get_llm_gateway
 from utils.utils import remove_code_blocks  # ✅ import the function
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,11 +21,11 @@ class ResearchAgent:
     """
 
     def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.llm = get_llm_gateway()
         self.description = "ResearchAgent: Adds qualitative, context-driven insights to market summaries."
         self.instructions = dedent("""
             Responsibilities:
-            1. Use the provided market summary to identify the relevant companies and sectors.
+            1. Use the provided market summary or ticker list to identify the relevant companies and sectors.
             2. For each ticker/company:
                 - Gather insights from at least 5 credible and diverse sources, including:
                     • Recent news articles
@@ -43,12 +43,21 @@ class ResearchAgent:
             5. Maintain a neutral, analytical tone with citations or source mentions when possible.
         """)
 
-    def analyze(self, market_summary: str) -> str:
+    def analyze_symbols(self, symbols: list[str], on_token=None, fresh=False) -> str:
+        """
+        Research the given tickers directly, without waiting for the
+        MarketAgent summary, so it can run alongside crawling and market analysis.
+        """
+        return self.analyze(f"Tickers to research: {', '.join(symbols)}", on_token=on_token, fresh=fresh)
+
+    def analyze(self, market_summary: str, on_token=None, fresh=False) -> str:
         """
         Enrich the market summary with qualitative research insights.
         
         Args:
             market_summary (str): Market summary from the MarketAgent.
+            on_token (callable, optional): Called with each streamed text delta.
+            fresh (bool, optional): Bypass the LLM response cache.
         
         Returns:
             str: A structured qualitative research report.
@@ -71,12 +80,15 @@ Market Summary:
 {market_summary_clean}
 """
         try:
-            response = self.client.chat.completions.create(
+            content = self.llm.complete(
+                agent="ResearchAgent",
                 model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                on_token=on_token,
+                use_cache=not fresh,
             )
             logger.info("ResearchAgent: Research complete")
-            return response.choices[0].message.content
+            return content
         except Exception as e:
             logger.error(f"ResearchAgent: Research failed — {e}")
             return "Error: Unable to perform research at this time."
@@ -2,14 +2,16 @@ import os
 import textwrap
 import sys
 import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-import google.generativeai as genai
-from langchain_community.tools import DuckDuckGoSearchRun
-from tavily import TavilyClient
-from langchain.agents import Tool, initialize_agent,AgentType
-from langchain_google_genai import ChatGoogleGenerativeAI
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.logging import logger
+from utils.cache import MemoryCache
+from utils.ticker_index import get_ticker_index, TICKER_PATTERN
+from utils.symbol_gate import drop_stopwords
 
 # Load env variables
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,31 +21,104 @@ load_dotenv(os.path.abspath(os.path.join(BASE_DIR, "../app",".env")))
 google_api_key = os.environ.get("GOOGLE_API_KEY")
 tavily_api_key = os.environ.get("TAVILY_API_KEY")
 
+GEMINI_MODEL = "gemini-2.0-flash"
+
+def normalize_query(query: str) -> str:
+    """Memo key for a query: case, punctuation and spacing do not matter."""
+    return " ".join(re.sub(r"[^\w.\-&]+", " ", query.lower()).split())
+
+
 class ResolverAgent:
     """
     Resolves ticker symbols from a user query.
-    Uses Gemini (via LangChain) with DuckDuckGo + Tavily as tools.
-    Falls back to Tavily search if LLM fails.
+    Fast path: explicit tickers and company names are looked up in the local
+    ticker index, then the normalized query is looked up in a memo cache.
+    Otherwise, depending on RESOLVER_MODE:
+    - "bounded" (default): DuckDuckGo and Tavily are searched concurrently and
+      one Gemini call extracts the symbols from the combined snippets as JSON,
+      within RESOLVER_DEADLINE seconds and RESOLVER_MAX_STEPS calls.
+    - "react": Gemini (via LangChain) with DuckDuckGo + Tavily as tools,
+      capped at RESOLVER_MAX_STEPS iterations and RESOLVER_DEADLINE seconds,
+      falling back to Tavily search if the LLM fails.
+    Gemini, Tavily and the LangChain agent are only imported and built the
+    first time a query misses the fast path.
     """
 
     def __init__(self):
-        # Configure Gemini + Tavily
-        genai.configure(api_key=google_api_key)
-        # self.gemini_model = genai.Model("gemini-2.0-flash")
-        self.tavily_client = TavilyClient(api_key=tavily_api_key)
-
-        # LLM wrapper
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.1)
-
-        # Setup tools + agent
-        self.tools = self.create_search_tools()
-        self.agent = initialize_agent(
-    tools=[self.tools["duckduck_search_tool"], self.tools["tavily_search_tool"]],
-    llm=self.llm,
-    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True,
-    handle_parsing_errors=True  # 👈 this must be inside the executor
-)
+        self.ticker_index = get_ticker_index()
+        self.memo = MemoryCache(
+            max_entries=int(os.environ.get("RESOLVER_MEMO_MAX_ENTRIES", 1024)),
+            default_ttl=float(os.environ.get("RESOLVER_MEMO_TTL", 6 * 3600)),
+        )
+        self.mode = os.environ.get("RESOLVER_MODE", "bounded")
+        self.deadline = float(os.environ.get("RESOLVER_DEADLINE", 20))
+        self.max_steps = int(os.environ.get("RESOLVER_MAX_STEPS", 3))
+        self._tavily_client = None
+        self._duckduckgo = None
+        self._gemini = None
+        self._agent = None
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="resolver")
+        self._client_lock = threading.Lock()
+        self._agent_lock = threading.Lock()
+
+    @property
+    def tavily_client(self):
+        with self._client_lock:
+            if self._tavily_client is None:
+                from tavily import TavilyClient
+                self._tavily_client = TavilyClient(api_key=tavily_api_key)
+            return self._tavily_client
+
+    @property
+    def duckduckgo(self):
+        with self._client_lock:
+            if self._duckduckgo is None:
+                from langchain_community.tools import DuckDuckGoSearchRun
+                self._duckduckgo = DuckDuckGoSearchRun()
+            return self._duckduckgo
+
+    @property
+    def gemini(self):
+        """Gemini model for single-shot JSON extraction."""
+        with self._client_lock:
+            if self._gemini is None:
+                import google.generativeai as genai
+                genai.configure(api_key=google_api_key)
+                self._gemini = genai.GenerativeModel(
+                    GEMINI_MODEL,
+                    generation_config={"temperature": 0.1, "response_mime_type": "application/json"},
+                )
+            return self._gemini
+
+    @property
+    def agent(self):
+        """LangChain ReAct agent (Gemini + DuckDuckGo + Tavily), built on first use."""
+        with self._agent_lock:
+            if self._agent is None:
+                import google.generativeai as genai
+                from langchain.agents import initialize_agent, AgentType
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                # Configure Gemini
+                genai.configure(api_key=google_api_key)
+                # self.gemini_model = genai.Model("gemini-2.0-flash")
+
+                # LLM wrapper
+                llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL, temperature=0.1)
+
+                # Setup tools + agent
+                tools = self.create_search_tools()
+                self._agent = initialize_agent(
+                    tools=[tools["duckduck_search_tool"], tools["tavily_search_tool"]],
+                    llm=llm,
+                    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                    verbose=True,
+                    handle_parsing_errors=True,  # 👈 this must be inside the executor
+                    max_iterations=self.max_steps,
+                    max_execution_time=self.deadline,
+                    early_stopping_method="generate",
+                )
+            return self._agent
 
     def tavily_search(self, query: str) -> str:
         """Run a Tavily search and return joined results as text."""
@@ -51,9 +126,8 @@ class ResolverAgent:
         return "\n".join([r["content"] for r in result["results"]])
 
     def create_search_tools(self) -> dict:
-        
         """Create and return search tools."""
-        duck_duck_client = DuckDuckGoSearchRun()
+        from langchain.agents import Tool
 
         tavily_tool = Tool(
             name="Tavily Search",
@@ -62,7 +136,7 @@ class ResolverAgent:
         )
         duckduck_tool = Tool(
             name="DuckDuckGo Search",
-            func=duck_duck_client.run,
+            func=self.duckduckgo.run,
             description="Use this tool to search the internet for current information."
         )
 
@@ -85,7 +159,8 @@ class ResolverAgent:
                 seen.add(s)
                 clean_symbols.append(s)
 
-        return clean_symbols
+        # Free text is full of CEO / ETF / NYSE: drop stopwords the index does not list
+        return drop_stopwords(clean_symbols, self.ticker_index)
     
     def clean_tickers(self,data):
         tickers = []
@@ -96,7 +171,139 @@ class ResolverAgent:
                 tickers.append(match.group())
         return tickers
 
+    def resolve_fast(self, user_query: str):
+        """
+        Resolve without any LLM or search call. The query must be entirely
+        made of tickers / company names ("AAPL, TSLA", "apple and tesla",
+        "AAPL FB"); returns None if any part is not in the ticker index.
+        Typo corrections ("APPL") only apply with a complete listing (see
+        TickerIndex); otherwise unknown tickers go on to the LLM resolver.
+        """
+        query = user_query.strip().strip(".?!")
+        if not query:
+            return None
+        found = self.ticker_index.resolve_token(query)
+        if found:
+            parts = [(query, found)]
+        else:
+            items = [p for p in re.split(r"\s*(?:[,;/]|\band\b|&)\s*", query) if p]
+            # "AAPL TSLA MSFT": whitespace-separated tickers
+            if len(items) == 1 and all(TICKER_PATTERN.match(w) and w.isupper() for w in items[0].split()):
+                items = items[0].split()
+            parts = [(item, self.ticker_index.resolve_token(item)) for item in items]
+            if not parts or any(found is None for _, found in parts):
+                return None
+
+        symbols = []
+        for item, (symbol, reason) in parts:
+            if reason in ("renamed", "typo"):
+                logger.info(f"ResolverAgent: '{item}' resolved to {symbol} ({reason})")
+            if symbol not in symbols:
+                symbols.append(symbol)
+        return symbols
+
     def resolve(self, user_query: str):
+        symbols = self.resolve_fast(user_query)
+        if symbols:
+            logger.info(f"ResolverAgent: fast path resolved {symbols}")
+            return symbols
+
+        key = normalize_query(user_query)
+        cached = self.memo.get(key)
+        if cached is not None:
+            logger.info(f"ResolverAgent: memo hit for '{key}'")
+            return list(cached)
+
+        if self.mode == "react":
+            return self.resolve_react(user_query)
+        return self.resolve_bounded(user_query)
+
+    def _remember(self, user_query: str, symbols: list[str]) -> list[str]:
+        """Memoize an LLM-confirmed answer (fallback guesses are never memoized)."""
+        if symbols:
+            self.memo.set(normalize_query(user_query), symbols)
+        return symbols
+
+    def _search_all(self, query: str, timeout: float) -> list[str]:
+        """Run the search tools concurrently; returns the snippets that arrived in time."""
+        searches = {
+            "Tavily": self.tavily_search,
+            "DuckDuckGo": lambda q: self.duckduckgo.run(q),
+        }
+        # One step is reserved for the extraction call
+        names = list(searches)[:max(1, self.max_steps - 1)]
+        futures = {self._pool.submit(searches[name], query): name for name in names}
+        done, pending = wait(futures, timeout=timeout)
+        for future in pending:
+            future.cancel()
+            logger.warning(f"ResolverAgent: {futures[future]} search missed its {timeout:.1f}s budget")
+        snippets = []
+        for future in done:
+            try:
+                snippets.append(f"[{futures[future]}]\n{future.result()}")
+            except Exception as e:
+                logger.warning(f"ResolverAgent: {futures[future]} search failed — {e}")
+        return snippets
+
+    def resolve_bounded(self, user_query: str) -> list[str]:
+        """
+        Concurrent searches, then one structured Gemini extraction, within
+        self.deadline seconds. Renames reported in "updated_symbols" are
+        applied to the answer. If the extraction call fails or runs out of
+        time, only snippet words that the ticker index lists are returned
+        (see _listed_symbols).
+        """
+        started = time.monotonic()
+        snippets = self._search_all(f"{user_query} stock ticker symbols", timeout=self.deadline / 2)
+        context = "\n\n".join(snippets)[:12000]
+
+        prompt = textwrap.dedent(f"""
+            Identify the publicly traded companies that best answer: "{user_query}".
+            Use the search results below; prefer current, primary US listings.
+            Respond with JSON only:
+            {{"symbols": ["XOM", "CVX"], "updated_symbols": {{"OLD": "NEW"}}}}
+            - "symbols": current ticker symbols, most relevant first (at most 15).
+            - "updated_symbols": renamed or misspelled tickers from the query, if any.
+
+            Search results:
+        """) + context
+
+        remaining = self.deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            logger.error("ResolverAgent: deadline reached during search, using search snippets")
+            return self._listed_symbols(context)
+        future = self._pool.submit(self.gemini.generate_content, prompt, request_options={"timeout": remaining})
+        try:
+            data = json.loads(future.result(timeout=remaining).text)
+            updated = {
+                str(old).strip().upper(): str(new).strip().upper()
+                for old, new in (data.get("updated_symbols") or {}).items()
+                if str(new).strip()
+            }
+            if updated:
+                logger.info(f"ResolverAgent: updated symbols {updated}")
+            symbols = [
+                updated.get(s.strip().upper(), s.strip().upper())
+                for s in data.get("symbols", []) if isinstance(s, str) and s.strip()
+            ]
+            logger.info(f"ResolverAgent: bounded resolution in {time.monotonic() - started:.1f}s -> {symbols}")
+            return self._remember(user_query, list(dict.fromkeys(symbols)))
+        except Exception as e:
+            future.cancel()
+            logger.error(f"ResolverAgent: Gemini extraction failed or timed out ({e!r}), using search snippets")
+            return self._listed_symbols(context)
+
+    def _listed_symbols(self, context: str, limit: int = 15) -> list[str]:
+        """
+        Fallback answer from raw search snippets: every uppercase word there
+        looks like a ticker, so only keep those the ticker index lists.
+        """
+        symbols = [s for s in self.extract_symbols(context) if s in self.ticker_index][:limit]
+        logger.info(f"ResolverAgent: listed symbols in search snippets -> {symbols}")
+        return symbols
+
+    def resolve_react(self, user_query: str) -> list[str]:
+        """LangChain ReAct agent, bounded by max_steps iterations and the deadline."""
         prompt = textwrap.dedent(f"""
             Find the current ticker symbols for: "{user_query}".
             - Only return ticker symbols (no company names, no exchanges).
@@ -114,12 +321,12 @@ class ResolverAgent:
             # print(f"LLM l2:\n{l2}\n")
             # l3=self.clean_tickers(l2)
             # print(f"LLM l3:\n{l3}\n")
-            return self.extract_symbols(response_text)
+            return self._remember(user_query, self.extract_symbols(response_text))
 
         except Exception as e:
             logger.error(f"LLM failed, falling back to Tavily: {e}")
             fallback_text = self.tavily_search(user_query)
-            matches = re.findall(r"\b[A-Z]{2,5}\b", fallback_text)
+            matches = drop_stopwords(re.findall(r"\b[A-Z]{2,5}\b", fallback_text), self.ticker_index)
             return list(set(matches)) if matches else []
 
 # def main():
@@ -1,12 +1,18 @@
-import matplotlib.pyplot as plt
 import uuid
 import os
+import sys
+import asyncio
+import threading
 
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, Header
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from agents.master_agent import MasterAgent
+from agents.registry import get_master_agent, preload
+from utils.rate_limit import get_quota_governor
+from utils.llm import get_llm_gateway
+from utils.executor import BoundedExecutor, QueueFullError
+from utils.jobs import JobManager, create_job_store
 import json
 
 # Initialize FastAPI app
@@ -20,25 +26,219 @@ os.makedirs(plots_path, exist_ok=True)
 # Serve frontend & static
 app.mount("/static", StaticFiles(directory=frontend_path), name="static")
 
-master_agent = MasterAgent()
+# Agents (and LangChain, Gemini, yfinance, pandas, ...) are built on first
+# use through the process-wide registry, so workers start serving quickly.
+# Set PRELOAD_AGENTS=1 to warm them up in the background right after startup.
+@app.on_event("startup")
+async def preload_agents():
+    if os.environ.get("PRELOAD_AGENTS", "0") == "1":
+        threading.Thread(target=preload, name="agent-preload", daemon=True).start()
+
+# Pipelines run blocking LLM/HTTP calls, so they are offloaded to a bounded
+# worker pool; the event loop stays free to serve other requests.
+pipeline_executor = BoundedExecutor(
+    max_workers=int(os.environ.get("PIPELINE_WORKERS", 4)),
+    max_queue=int(os.environ.get("PIPELINE_QUEUE_SIZE", 8)),
+)
+
+# Background jobs share the same pool; finished jobs expire after JOB_TTL seconds
+job_manager = JobManager(
+    pipeline_executor,
+    store=create_job_store(),
+    ttl=float(os.environ.get("JOB_TTL", 3600)),
+)
 
 class QueryRequest(BaseModel):
     query: str | None = None
     symbols: list[str] | None = None
     alpha_key: str | None = None
     finnhub_key: str | None = None
+    fresh: bool = False  # bypass the LLM response cache
+    incremental: bool = False  # only re-analyse symbols whose data changed
 
 @app.get("/", response_class=HTMLResponse)
 async def serve_frontend():
     index_file = os.path.abspath(os.path.join(frontend_path, "index.html"))
     return FileResponse(index_file)
 
+@app.get("/quota/")
+async def quota_status():
+    # Remaining Alpha Vantage / Finnhub quota per API key
+    return JSONResponse(content={"quota": get_quota_governor().report()})
+
+@app.get("/llm_metrics/")
+async def llm_metrics():
+    # Per-agent LLM call counts, latency and token usage
+    gateway = get_llm_gateway()
+    return JSONResponse(content={"agents": gateway.metrics(), "cache": gateway.cache_stats()})
+
+@app.get("/pipeline_status/")
+async def pipeline_status():
+    return JSONResponse(content=pipeline_executor.stats())
+
+def server_busy(error: QueueFullError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": f"Server busy, please retry shortly ({error})"},
+        headers={"Retry-After": "10"},
+    )
+
+def run_request(request: QueryRequest, on_event=None, cancel_event=None) -> dict:
+    """Run the pipeline for a symbol list or a natural language query."""
+    master_agent = get_master_agent()
+    if request.symbols:
+        return master_agent.execute_pipeline(
+            request.symbols,
+            alpha_key=request.alpha_key,
+            finnhub_key=request.finnhub_key,
+            on_event=on_event,
+            cancel_event=cancel_event,
+            fresh=request.fresh,
+            incremental=request.incremental,
+        )
+    return json.loads(master_agent.resolve_and_execute(
+        request.query,
+        alpha_key=request.alpha_key,
+        finnhub_key=request.finnhub_key,
+        on_event=on_event,
+        cancel_event=cancel_event,
+        fresh=request.fresh,
+        incremental=request.incremental,
+    ))
+
+@app.post("/jobs/", status_code=202)
+async def submit_job(request: QueryRequest):
+    if not request.query and not request.symbols:
+        return JSONResponse(status_code=400, content={"error": "Provide a query or a list of symbols"})
+    params = {"query": request.query, "symbols": request.symbols}
+    try:
+        job = job_manager.submit(
+            lambda job: run_request(request, on_event=job.record_stage, cancel_event=job.cancel_event),
+            kind="pipeline",
+            params=params,
+        )
+    except QueueFullError as e:
+        return server_busy(e)
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job"})
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = job_manager.get(job_id, include_result=True)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job"})
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if not job_manager.cancel(job_id):
+        return JSONResponse(status_code=404, content={"error": "Unknown or already finished job"})
+    return {"job_id": job_id, "status": "cancelling"}
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def format_event(stage, status, value) -> str:
+    """Shape a pipeline event for the browser; raw crawl data is reduced to source names."""
+    if status == "token":
+        return sse("token", {"stage": stage, **value})
+    if stage in ("crawl", "history") and status == "completed" and isinstance(value, dict):
+        value = {sym: sorted(sources) for sym, sources in value.items()}
+    return sse("stage", {"stage": stage, "status": status, "value": value})
+
+@app.get("/stream_pipeline/")
+async def stream_pipeline(query: str | None = None, symbols: str | None = None, fresh: bool = False,
+                          incremental: bool = False,
+                          alpha_key: str | None = Header(None, alias="X-Alpha-Vantage-Key"),
+                          finnhub_key: str | None = Header(None, alias="X-Finnhub-Key")):
+    """
+    Server-Sent Events stream of a pipeline run: one "stage" event per
+    stage transition (resolved symbols, market summary, research, ...),
+    "token" events with streamed LLM text, then a final "result" event.
+    Own API keys go in the X-Alpha-Vantage-Key / X-Finnhub-Key headers,
+    never in the URL, so they stay out of access logs.
+    """
+    if not query and not symbols:
+        return JSONResponse(status_code=400, content={"error": "Provide a query or a list of symbols"})
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancel_event = threading.Event()
+
+    def on_event(stage, status, value):
+        # Called from worker threads; hand events over to the event loop
+        loop.call_soon_threadsafe(events.put_nowait, (stage, status, value))
+
+    request = QueryRequest(
+        query=query,
+        symbols=[s.strip().upper() for s in symbols.split(",") if s.strip()] if symbols else None,
+        alpha_key=alpha_key,
+        finnhub_key=finnhub_key,
+        fresh=fresh,
+        incremental=incremental,
+    )
+
+    try:
+        future = pipeline_executor.submit(run_request, request, on_event=on_event, cancel_event=cancel_event)
+    except QueueFullError as e:
+        return server_busy(e)
+
+    async def event_stream():
+        done = asyncio.wrap_future(future)
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.get())
+                finished, _ = await asyncio.wait({next_event, done}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event in finished:
+                    yield format_event(*next_event.result())
+                    continue
+
+                next_event.cancel()
+                await asyncio.sleep(0)  # let already scheduled events land
+                while not events.empty():
+                    yield format_event(*events.get_nowait())
+                try:
+                    yield sse("result", done.result())
+                except Exception as e:
+                    yield sse("error", {"error": str(e)})
+                break
+        finally:
+            # Client went away (or run finished): stop at the next stage boundary
+            cancel_event.set()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/run_pipeline/")
 async def run_pipeline(request: QueryRequest):
-    result = master_agent.resolve_and_execute(request.query)
+    try:
+        result = await pipeline_executor.run(
+            get_master_agent().resolve_and_execute,
+            request.query,
+            alpha_key=request.alpha_key,
+            finnhub_key=request.finnhub_key,
+            fresh=request.fresh,
+            incremental=request.incremental,
+        )
+    except QueueFullError as e:
+        return server_busy(e)
+
+    # Case 1: result is a matplotlib figure (only possible if matplotlib was loaded)
+    figure_module = sys.modules.get("matplotlib.figure")
+    if figure_module is not None and isinstance(result, figure_module.Figure):
+        import matplotlib.pyplot as plt
 
-    # Case 1: result is a matplotlib figure
-    if isinstance(result, plt.Figure):
         filename = f"{uuid.uuid4().hex}.png"
         filepath = os.path.join(plots_path, filename)
         result.savefig(filepath)
@@ -1,20 +1,98 @@
-async function analyze() {
-    const topic = document.getElementById("topic").value;
+// Stages of /stream_pipeline/, in display order
+const STAGES = [
+    ["resolve", "Resolved Symbols"],
+    ["crawl", "Market Data Sources"],
+    ["screen", "Screening"],
+    ["market", "Market Analysis"],
+    ["research", "Research"],
+    ["analyst", "Analyst Report"],
+    ["portfolio", "Portfolio Analysis"],
+    ["recommend", "Recommendations"],
+];
 
-    try {
-        const response = await fetch(`/analyze/${encodeURIComponent(topic)}`);
-        const data = await response.json();
+let stream = null;
 
-        // ✅ Backend should always return { "result": { "output": "..." } }
-        const markdown = data.result.output;
+function analyze() {
+    const topic = document.getElementById("topic").value.trim();
+    if (!topic) return;
+    if (stream) stream.close();
 
-        // Use marked.js if you want Markdown rendering:
-        document.getElementById("result").innerHTML = marked.parse(markdown);
+    const container = document.getElementById("result");
+    container.innerHTML = "";
+    const sections = {};
+    for (const [stage, title] of STAGES) {
+        const el = document.createElement("section");
+        el.innerHTML = `<h2>${title}</h2><p class="text-sm text-gray-500">Waiting…</p><div></div>`;
+        container.appendChild(el);
+        sections[stage] = { el, parts: {}, pending: false, seen: false };
+    }
+    colorHeadings(container);
+
+    stream = new EventSource(`/stream_pipeline/?query=${encodeURIComponent(topic)}`);
+
+    stream.addEventListener("stage", (e) => {
+        const { stage, status, value } = JSON.parse(e.data);
+        const section = sections[stage];
+        if (!section) return;
+        section.seen = true;
+        section.el.querySelector("p").textContent = status;
+        if (status === "completed") {
+            section.parts = { "": stageMarkdown(stage, value) };
+            render(section);
+        }
+    });
+
+    // Streamed LLM text, grouped per symbol within a stage
+    stream.addEventListener("token", (e) => {
+        const { stage, symbol, text } = JSON.parse(e.data);
+        const section = sections[stage];
+        if (!section) return;
+        const key = symbol || "";
+        section.parts[key] = (section.parts[key] || "") + text;
+        render(section);
+    });
 
-        // Or, if you just want plain text (no Markdown parsing):
-        // document.getElementById("result").textContent = markdown;
+    stream.addEventListener("result", (e) => {
+        const result = JSON.parse(e.data);
+        // Stages the run did not use (e.g. portfolio merge for a single symbol)
+        for (const section of Object.values(sections)) {
+            if (!section.seen) section.el.remove();
+        }
+        if (result && result.error) {
+            container.insertAdjacentHTML("afterbegin", `<p class="text-rose-600">❌ ${result.error}</p>`);
+        }
+        stream.close();
+    });
 
-    } catch (error) {
-        document.getElementById("result").textContent = "❌ Error: " + error.message;
+    stream.addEventListener("error", (e) => {
+        const message = e.data ? JSON.parse(e.data).error : "Connection lost";
+        container.insertAdjacentHTML("afterbegin", `<p class="text-rose-600">❌ Error: ${message}</p>`);
+        stream.close();
+    });
+}
+
+function stageMarkdown(stage, value) {
+    if (stage === "resolve") return (value || []).map((s) => `**${s}**`).join(", ");
+    if (stage === "crawl") {
+        return Object.entries(value || {})
+            .map(([sym, sources]) => `- **${sym}**: ${sources.length ? sources.join(", ") : "no data"}`)
+            .join("\n");
     }
+    if (value && typeof value === "object" && "markdown" in value) return value.markdown;
+    return normalizeOutput({ result: { output: value } });
+}
+
+// Re-render at most once per animation frame while tokens stream in
+function render(section) {
+    if (section.pending) return;
+    section.pending = true;
+    requestAnimationFrame(() => {
+        section.pending = false;
+        const markdown = Object.entries(section.parts)
+            .map(([symbol, text]) => (symbol ? `### ${symbol}\n${text}` : text))
+            .join("\n\n");
+        const body = section.el.querySelector("div");
+        body.innerHTML = marked.parse(markdown);
+        colorHeadings(body);
+    });
 }
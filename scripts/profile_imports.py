@@ -0,0 +1,65 @@
+# scripts/profile_imports.py
+"""
+Import-time profile of the web app (cold start of a uvicorn worker).
+
+    python scripts/profile_imports.py                 # profile app.main
+    python scripts/profile_imports.py agents.master_agent --top 30
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+prints the total import time plus the slowest top-level packages and modules
+(cumulative microseconds, as reported by CPython).
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(module: str):
+    """Return [(module, self_us, cumulative_us, depth)] for one cold import of module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr.splitlines()[-1] + "\n" if proc.stderr else "")
+        raise SystemExit(f"Importing {module} failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = profile(args.module)
+    total = next((cum for name, _, cum, _ in rows if name == args.module), sum(r[1] for r in rows))
+    print(f"{args.module}: {total / 1000:.1f} ms, {len(rows)} modules")
+
+    packages = {}
+    for name, _, cumulative, depth in rows:
+        if depth == 0:
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0) + cumulative
+    print("\nSlowest top-level packages:")
+    for root, cumulative in sorted(packages.items(), key=lambda p: -p[1])[:args.top]:
+        print(f"  {cumulative / 1000:9.1f} ms  {root}")
+
+    print("\nSlowest modules (self time):")
+    for name, self_us, _, _ in sorted(rows, key=lambda r: -r[1])[:args.top]:
+        print(f"  {self_us / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# utils/cache.py
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from utils.logging import logger
+
+
+class MemoryCache:
+    """
+    In-process TTL cache with LRU eviction once max_entries is reached.
+    Thread-safe; tracks hit/miss/eviction counters.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float | None = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteCache:
+    """
+    On-disk TTL cache backed by SQLite, so entries survive restarts.
+    Values are stored as JSON. Least recently accessed rows are evicted
+    once max_entries is reached.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, default_ttl: float | None = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        return count
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def create_cache(backend: str = "memory", path: str | None = None, max_entries: int = 1024,
+                 default_ttl: float | None = None):
+    """Build a cache backend by name: "memory" or "sqlite"."""
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("SQLite cache requires a path")
+        return SQLiteCache(path, max_entries=max_entries, default_ttl=default_ttl)
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, default_ttl=default_ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+# Freshness policy per source, in seconds
+DEFAULT_SOURCE_TTLS = {
+    "yahoo": 60,
+    "finnhub": 30,
+    "google_finance": 60,
+    "alpha_vantage": 6 * 60 * 60,  # TIME_SERIES_DAILY only changes once a day
+}
+
+
+class MarketDataCache:
+    """
+    Caches crawled market data keyed by (source, symbol, function),
+    with a per-source TTL. Failed fetches (empty results) are not cached.
+    """
+
+    def __init__(self, backend=None, ttls: dict | None = None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = {**DEFAULT_SOURCE_TTLS, **(ttls or {})}
+
+    @staticmethod
+    def key(source: str, symbol: str, function: str) -> str:
+        return f"{source}:{function}:{symbol.upper()}"
+
+    def get(self, source, symbol, function):
+        return self.backend.get(self.key(source, symbol, function))
+
+    def set(self, source, symbol, function, data):
+        self.backend.set(self.key(source, symbol, function), data, ttl=self.ttls.get(source, 60))
+
+    def get_or_fetch(self, source, symbol, function, fetch):
+        data = self.get(source, symbol, function)
+        if data is not None:
+            return data
+        data = fetch()
+        if data:
+            self.set(source, symbol, function, data)
+        return data
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+_market_cache = None
+_market_cache_lock = threading.Lock()
+
+
+def get_market_data_cache() -> MarketDataCache:
+    """
+    Return the process-wide MarketDataCache, configured from env:
+    MARKET_CACHE_BACKEND (memory|sqlite), MARKET_CACHE_PATH,
+    MARKET_CACHE_MAX_ENTRIES and MARKET_CACHE_TTL_<SOURCE> (seconds).
+    """
+    global _market_cache
+    with _market_cache_lock:
+        if _market_cache is None:
+            backend = create_cache(
+                backend=os.environ.get("MARKET_CACHE_BACKEND", "memory"),
+                path=os.environ.get("MARKET_CACHE_PATH", os.path.join(".cache", "market_data.sqlite")),
+                max_entries=int(os.environ.get("MARKET_CACHE_MAX_ENTRIES", 2048)),
+            )
+            ttls = {
+                source: float(os.environ[f"MARKET_CACHE_TTL_{source.upper()}"])
+                for source in DEFAULT_SOURCE_TTLS
+                if f"MARKET_CACHE_TTL_{source.upper()}" in os.environ
+            }
+            _market_cache = MarketDataCache(backend, ttls=ttls)
+            logger.info(f"Market data cache initialised ({backend.stats()['backend']})")
+        return _market_cache
+
+
+# Freshness policy per per-symbol stage output, in seconds
+DEFAULT_STAGE_TTLS = {
+    "market": 15 * 60,
+    "research": 6 * 60 * 60,  # news and sector context move slowly
+    "analyst": 30 * 60,
+}
+
+
+class SymbolResultCache:
+    """
+    Caches per-symbol stage outputs keyed by (stage, symbol, input digest),
+    with a per-stage TTL, so a symbol analysed for one query is reused by
+    any later query that includes it with the same inputs.
+    """
+
+    def __init__(self, backend=None, ttls: dict | None = None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = {**DEFAULT_STAGE_TTLS, **(ttls or {})}
+
+    @staticmethod
+    def digest(*inputs) -> str:
+        payload = json.dumps(inputs, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def key(stage: str, symbol: str, digest: str) -> str:
+        return f"{stage}:{symbol.upper()}:{digest}"
+
+    def get(self, stage, symbol, digest):
+        return self.backend.get(self.key(stage, symbol, digest))
+
+    def set(self, stage, symbol, digest, value):
+        self.backend.set(self.key(stage, symbol, digest), value, ttl=self.ttls.get(stage, 15 * 60))
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+_symbol_cache = None
+_symbol_cache_lock = threading.Lock()
+
+
+def get_symbol_result_cache() -> SymbolResultCache:
+    """
+    Return the process-wide SymbolResultCache, configured from env:
+    SYMBOL_CACHE_BACKEND (memory|sqlite), SYMBOL_CACHE_PATH,
+    SYMBOL_CACHE_MAX_ENTRIES and SYMBOL_CACHE_TTL_<STAGE> (seconds).
+    """
+    global _symbol_cache
+    with _symbol_cache_lock:
+        if _symbol_cache is None:
+            backend = create_cache(
+                backend=os.environ.get("SYMBOL_CACHE_BACKEND", "memory"),
+                path=os.environ.get("SYMBOL_CACHE_PATH", os.path.join(".cache", "symbol_results.sqlite")),
+                max_entries=int(os.environ.get("SYMBOL_CACHE_MAX_ENTRIES", 2048)),
+            )
+            ttls = {
+                stage: float(os.environ[f"SYMBOL_CACHE_TTL_{stage.upper()}"])
+                for stage in DEFAULT_STAGE_TTLS
+                if f"SYMBOL_CACHE_TTL_{stage.upper()}" in os.environ
+            }
+            _symbol_cache = SymbolResultCache(backend, ttls=ttls)
+            logger.info(f"Symbol result cache initialised ({backend.stats()['backend']})")
+        return _symbol_cache
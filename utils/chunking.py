@@ -0,0 +1,134 @@
+# utils/chunking.py
+import math
+from utils.logging import logger
+
+
+# Characters per token measured on our prompts (prose + CSV tables) for the
+# Groq models in use. Only used when tiktoken is not installed.
+MODEL_CHARS_PER_TOKEN = {
+    "llama-3.3-70b-versatile": 3.6,
+    "qwen/qwen3-32b": 3.4,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    # tiktoken is optional: a BPE tokenizer close to the Llama 3 vocabulary
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.info(f"tiktoken unavailable, using calibrated token estimates ({e})")
+    return _encoding
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with a real BPE tokenizer when tiktoken is
+    installed, otherwise with a per-model calibrated chars/token ratio.
+    """
+
+    def __init__(self, model: str | None = None):
+        self.model = model
+        self.chars_per_token = MODEL_CHARS_PER_TOKEN.get(model, DEFAULT_CHARS_PER_TOKEN)
+        self.encoding = _get_encoding()
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+def _split_oversized(unit: str, max_tokens: int, counter: TokenCounter) -> list[str]:
+    """Split a unit that exceeds max_tokens on lines, then on characters."""
+    if counter.count(unit) <= max_tokens:
+        return [unit]
+
+    lines = unit.splitlines()
+    if len(lines) > 1:
+        return _pack(lines, max_tokens, counter)
+
+    pieces, rest = [], unit
+    while rest:
+        tokens = counter.count(rest)
+        if tokens <= max_tokens:
+            pieces.append(rest)
+            break
+        # Shrink the window until it fits (estimate first, then tighten)
+        size = max(1, int(len(rest) * max_tokens / tokens * 0.95))
+        while size > 1 and counter.count(rest[:size]) > max_tokens:
+            size = int(size * 0.9)
+        pieces.append(rest[:size])
+        rest = rest[size:]
+    return pieces
+
+
+def _pack(units: list[str], max_tokens: int, counter: TokenCounter, overlap_tokens: int = 0,
+          separator: str = "\n") -> list[str]:
+    """
+    Greedily pack units into chunks of at most max_tokens, keeping a running
+    token count so packing is linear in the number of units.
+    """
+    sep_tokens = counter.count(separator) if separator.strip() else 1
+    chunks, current, current_tokens = [], [], 0
+
+    for unit in units:
+        for piece in _split_oversized(unit, max_tokens, counter):
+            tokens = counter.count(piece)
+            if current and current_tokens + sep_tokens + tokens > max_tokens:
+                chunks.append(separator.join(current))
+                current, current_tokens = _overlap_tail(current, overlap_tokens, counter, sep_tokens)
+                if current and current_tokens + sep_tokens + tokens > max_tokens:
+                    current, current_tokens = [], 0
+            if current:
+                current_tokens += sep_tokens
+            current.append(piece)
+            current_tokens += tokens
+
+    if current:
+        chunks.append(separator.join(current))
+
+    return [c for c in chunks if c.strip()]
+
+
+def _overlap_tail(units: list[str], overlap_tokens: int, counter: TokenCounter, sep_tokens: int):
+    """Trailing units of the previous chunk, up to overlap_tokens, to carry over."""
+    if overlap_tokens <= 0:
+        return [], 0
+    tail, total = [], 0
+    for unit in reversed(units):
+        tokens = counter.count(unit) + (sep_tokens if tail else 0)
+        if total + tokens > overlap_tokens:
+            break
+        tail.insert(0, unit)
+        total += tokens
+    return tail, total
+
+
+def chunk_text(text: str, max_input_tokens: int = 10000, model: str | None = None,
+               overlap_tokens: int = 0) -> list[str]:
+    """
+    Splits text into line-aligned chunks of at most max_input_tokens tokens.
+    Never returns empty chunks; oversized lines are split further.
+    """
+    counter = TokenCounter(model)
+    return _pack(text.splitlines(), max_input_tokens, counter, overlap_tokens)
+
+
+def chunk_sections(sections: list[str], max_input_tokens: int = 10000, model: str | None = None,
+                   overlap_tokens: int = 0) -> list[str]:
+    """
+    Packs structural units (e.g. one block per symbol or per JSON object)
+    into chunks without splitting a unit unless it alone exceeds the budget.
+    """
+    counter = TokenCounter(model)
+    return _pack([s for s in sections if s.strip()], max_input_tokens, counter, overlap_tokens,
+                 separator="\n\n")
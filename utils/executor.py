@@ -0,0 +1,70 @@
+# utils/executor.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class QueueFullError(Exception):
+    """Raised when a BoundedExecutor has no free worker or queue slot."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with admission control: at most max_workers jobs run and
+    at most max_queue wait; further submissions are rejected immediately
+    with QueueFullError instead of piling up.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 8, name: str = "pipeline"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+
+    def _wrap(self, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _release(self, _future):
+        with self._lock:
+            self._admitted -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(
+                f"All {self.max_workers} workers busy and {self.max_queue} jobs queued"
+            )
+        try:
+            future = self._pool.submit(self._wrap, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._admitted += 1
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Submit from async code and await the result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": max(0, self._admitted - self._running),
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
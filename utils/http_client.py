@@ -0,0 +1,102 @@
+# utils/http_client.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.logging import logger
+
+
+# Defaults, overridable through HTTP_* variables in app/.env
+DEFAULT_SETTINGS = {
+    "HTTP_TIMEOUT": 10,
+    "HTTP_POOL_CONNECTIONS": 10,
+    "HTTP_POOL_MAXSIZE": 20,
+    "HTTP_MAX_RETRIES": 3,
+    "HTTP_BACKOFF_FACTOR": 0.5,
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Hosts paced by the QuotaGovernor: their 429s are returned to the caller
+# so the governor sees the throttle and slows every caller, instead of the
+# adapter sleeping on Retry-After inside a single governor token.
+GOVERNED_HOSTS = ("https://www.alphavantage.co", "https://finnhub.io")
+GOVERNED_RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class HttpClient:
+    """
+    Shared HTTP client used by all market data fetchers.
+    - Keeps a keep-alive connection pool per host (pool_connections hosts,
+      pool_maxsize sockets per host).
+    - Retries idempotent requests on connection errors and 429/5xx
+      responses with exponential backoff, honouring Retry-After.
+      For GOVERNED_HOSTS only 5xx are retried; 429 is left to the governor.
+    - Applies a default timeout to every call.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, max_retries=3, backoff_factor=0.5, timeout=10):
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.session = requests.Session()
+        adapter = self._adapter(max_retries, backoff_factor, RETRY_STATUSES)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Longest matching prefix wins, so these override the default adapter
+        governed = self._adapter(max_retries, backoff_factor, GOVERNED_RETRY_STATUSES)
+        for host in GOVERNED_HOSTS:
+            self.session.mount(host, governed)
+
+    def _adapter(self, max_retries, backoff_factor, statuses):
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=statuses,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        return HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide HttpClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Read settings on first use so values from app/.env are picked up
+            settings = {k: float(os.environ.get(k, v)) for k, v in DEFAULT_SETTINGS.items()}
+            _client = HttpClient(
+                pool_connections=int(settings["HTTP_POOL_CONNECTIONS"]),
+                pool_maxsize=int(settings["HTTP_POOL_MAXSIZE"]),
+                max_retries=int(settings["HTTP_MAX_RETRIES"]),
+                backoff_factor=settings["HTTP_BACKOFF_FACTOR"],
+                timeout=settings["HTTP_TIMEOUT"],
+            )
+            logger.info(
+                f"HTTP client initialised (pool_connections={_client.pool_connections}, "
+                f"pool_maxsize={_client.pool_maxsize}, timeout={_client.timeout}s)"
+            )
+        return _client
+
+
+def http_get(url, **kwargs):
+    """GET through the shared pooled session."""
+    return get_http_client().get(url, **kwargs)
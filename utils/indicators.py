@@ -0,0 +1,111 @@
+# utils/indicators.py
+import numpy as np
+import pandas as pd
+
+
+TRADING_DAYS = 252
+
+# Columns of the compact indicator table sent to the LLM
+INDICATOR_COLUMNS = [
+    "last_close", "chg_1d_pct", "sma_20", "sma_50", "sma_200", "ema_12", "ema_26", "rsi_14",
+    "macd", "macd_signal", "macd_hist", "vol_20d_ann_pct", "ret_1y_pct", "off_52w_high_pct",
+    "max_drawdown_pct", "volume_z_20", "bars",
+]
+
+
+def sma(close: pd.Series, window: int) -> pd.Series:
+    return close.rolling(window, min_periods=window).mean()
+
+
+def ema(close: pd.Series, span: int) -> pd.Series:
+    return close.ewm(span=span, adjust=False, min_periods=span).mean()
+
+
+def rsi(close: pd.Series, period: int = 14) -> pd.Series:
+    """Wilder's RSI."""
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    rs = gain / loss.replace(0, np.nan)
+    return (100 - 100 / (1 + rs)).where(loss != 0, 100.0)
+
+
+def macd(close: pd.Series, fast: int = 12, slow: int = 26, signal: int = 9):
+    """Returns (macd line, signal line, histogram)."""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = line.ewm(span=signal, adjust=False, min_periods=signal).mean()
+    return line, signal_line, line - signal_line
+
+
+def realized_volatility(close: pd.Series, window: int = 20) -> pd.Series:
+    """Annualised rolling volatility of daily log returns."""
+    log_returns = np.log(close).diff()
+    return log_returns.rolling(window, min_periods=window).std() * np.sqrt(TRADING_DAYS)
+
+
+def max_drawdown(close: pd.Series) -> float:
+    """Largest peak-to-trough decline over the series (negative fraction)."""
+    drawdown = close / close.cummax() - 1
+    return float(drawdown.min())
+
+
+def volume_zscore(volume: pd.Series, window: int = 20) -> pd.Series:
+    mean = volume.rolling(window, min_periods=window).mean()
+    std = volume.rolling(window, min_periods=window).std()
+    return (volume - mean) / std.replace(0, np.nan)
+
+
+def trailing_return(close: pd.Series, periods: int = TRADING_DAYS) -> float:
+    """Return over the last `periods` bars (NaN if the history is shorter)."""
+    if len(close) <= periods:
+        return np.nan
+    return float(close.iloc[-1] / close.iloc[-1 - periods] - 1)
+
+
+def compute_indicators(frame: pd.DataFrame) -> dict:
+    """
+    Compute the latest value of every indicator for one OHLCV frame.
+    Long-window columns (sma_200, ret_1y_pct, off_52w_high_pct) need the
+    multi-year history kept in the OHLCV store and are empty otherwise.
+    """
+    close = frame["close"]
+    macd_line, signal_line, hist = macd(close)
+    high_52w = close.iloc[-TRADING_DAYS:].max()
+    latest = {
+        "last_close": close.iloc[-1],
+        "chg_1d_pct": close.pct_change().iloc[-1] * 100,
+        "sma_20": sma(close, 20).iloc[-1],
+        "sma_50": sma(close, 50).iloc[-1],
+        "sma_200": sma(close, 200).iloc[-1],
+        "ema_12": ema(close, 12).iloc[-1],
+        "ema_26": ema(close, 26).iloc[-1],
+        "rsi_14": rsi(close).iloc[-1],
+        "macd": macd_line.iloc[-1],
+        "macd_signal": signal_line.iloc[-1],
+        "macd_hist": hist.iloc[-1],
+        "vol_20d_ann_pct": realized_volatility(close).iloc[-1] * 100,
+        "ret_1y_pct": trailing_return(close) * 100,
+        "off_52w_high_pct": (close.iloc[-1] / high_52w - 1) * 100 if len(close) >= TRADING_DAYS else np.nan,
+        "max_drawdown_pct": max_drawdown(close) * 100,
+        "volume_z_20": volume_zscore(frame["volume"]).iloc[-1] if "volume" in frame else np.nan,
+        "bars": len(frame),
+    }
+    return {k: (None if pd.isna(v) else round(float(v), 2)) for k, v in latest.items()}
+
+
+def _format_row(values) -> str:
+    return ",".join("" if v is None else str(v) for v in values)
+
+
+def indicator_table(records: dict) -> str:
+    """
+    Build a compact CSV-style indicator table from normalized records
+    ({symbol: SymbolRecord}). Symbols without daily history are skipped.
+    """
+    rows = ["symbol," + ",".join(INDICATOR_COLUMNS)]
+    for symbol, record in records.items():
+        if not record.has_history():
+            continue
+        metrics = compute_indicators(record.frame())
+        rows.append(_format_row([symbol] + [metrics[c] for c in INDICATOR_COLUMNS]))
+    return "\n".join(rows) if len(rows) > 1 else ""
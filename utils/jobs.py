@@ -0,0 +1,142 @@
+# utils/jobs.py
+import os
+import time
+import uuid
+import threading
+from utils.logging import logger
+from utils.cache import create_cache
+from utils.pipeline import PipelineCancelled
+
+
+class Job:
+    """
+    A background pipeline run.
+    status: queued -> running -> completed | failed | cancelled
+    stages: latest status per pipeline stage, e.g. {"crawl": "completed"}
+    """
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.stages = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def record_stage(self, stage, status, value=None):
+        """Pipeline on_event callback: track per-stage progress."""
+        if status == "token":
+            return
+        self.stages[stage] = status
+
+    def to_dict(self, include_result: bool = False) -> dict:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "stages": dict(self.stages),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """
+    Runs job bodies on a BoundedExecutor and keeps finished jobs in a
+    result store (memory or SQLite cache) until they expire.
+    The job body is called as fn(job) and may use job.record_stage and
+    job.cancel_event to report progress and honour cancellation.
+    """
+
+    def __init__(self, executor, store=None, ttl: float = 3600):
+        self.executor = executor
+        self.ttl = ttl
+        self.store = store if store is not None else create_cache("memory", max_entries=1000)
+        self._jobs = {}  # live (queued / running) jobs
+        self._lock = threading.Lock()
+
+    def submit(self, fn, kind: str, params: dict) -> Job:
+        """Queue a job; raises QueueFullError if the executor is saturated."""
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            job.future = self.executor.submit(self._run, job, fn)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        logger.info(f"JobManager: queued {kind} job {job.id}")
+        return job
+
+    def _run(self, job, fn):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            self._finish(job)
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.status = "completed"
+        except PipelineCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.error(f"JobManager: job {job.id} failed — {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        job.finished_at = time.time()
+        self.store.set(job.id, job.to_dict(include_result=True), ttl=self.ttl)
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        logger.info(f"JobManager: job {job.id} {job.status}")
+
+    def get(self, job_id: str, include_result: bool = False) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict(include_result=include_result)
+        data = self.store.get(job_id)
+        if data is not None and not include_result:
+            data = {k: v for k, v in data.items() if k != "result"}
+        return data
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job. Queued jobs never start; running jobs stop at the next
+        stage boundary. Returns False if the job is unknown or already finished.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+            self._finish(job)
+        return True
+
+
+def create_job_store():
+    """Result store from env: JOB_STORE_BACKEND (memory|sqlite), JOB_STORE_PATH."""
+    return create_cache(
+        backend=os.environ.get("JOB_STORE_BACKEND", "memory"),
+        path=os.environ.get("JOB_STORE_PATH", os.path.join(".cache", "jobs.sqlite")),
+        max_entries=int(os.environ.get("JOB_STORE_MAX_ENTRIES", 1000)),
+    )
@@ -0,0 +1,263 @@
+# utils/llm.py
+import os
+import json
+import time
+import hashlib
+import threading
+from groq import Groq, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from utils.logging import logger
+from utils.cache import create_cache
+
+
+# Alternate models tried, in order, when a model is saturated (rate limited,
+# or its concurrency slots stay busy past saturation_wait when that is set)
+DEFAULT_FALLBACKS = {
+    "llama-3.3-70b-versatile": ["llama-3.1-8b-instant"],
+    "qwen/qwen3-32b": ["llama-3.3-70b-versatile"],
+}
+
+RETRYABLE_ERRORS = (APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class LLMError(Exception):
+    """Raised when a completion cannot be produced within its deadline."""
+
+
+class ModelSaturated(Exception):
+    """Internal: the requested model is saturated and a fallback should be tried."""
+
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Single entry point for every Groq completion made by the agents.
+    - One pooled client per API key, shared by all agents and threads.
+    - Global and per-model concurrency semaphores.
+    - Exponential backoff on transient errors; 429s honour Retry-After.
+    - Per-call deadline covering queueing, retries and the request itself.
+    - Fallback to an alternate model when a model is rate limited. Busy
+      concurrency slots are ordinary queueing: calls wait for the requested
+      model unless saturation_wait (seconds) is set, after which they fall
+      back too.
+    - Latency and token metrics per agent.
+    - Optional response cache keyed by a hash of (model, messages), so
+      identical prompts from any agent are answered without a Groq call.
+    """
+
+    def __init__(self, max_concurrency=8, model_concurrency=4, timeout=60, max_retries=3, backoff=1.0,
+                 saturation_wait=None, fallbacks=None, cache=None, cache_ttl=1800):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.saturation_wait = saturation_wait
+        self.model_concurrency = model_concurrency
+        self.fallbacks = DEFAULT_FALLBACKS if fallbacks is None else fallbacks
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self._global_slots = threading.BoundedSemaphore(max_concurrency)
+        self._model_slots = {}
+        self._clients = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def client(self, api_key=None) -> Groq:
+        api_key = api_key or os.environ.get("GROQ_API_KEY")
+        with self._lock:
+            if api_key not in self._clients:
+                # Retries are handled here, not inside the SDK
+                self._clients[api_key] = Groq(api_key=api_key, max_retries=0)
+            return self._clients[api_key]
+
+    def _model_slot(self, model):
+        with self._lock:
+            if model not in self._model_slots:
+                self._model_slots[model] = threading.BoundedSemaphore(self.model_concurrency)
+            return self._model_slots[model]
+
+    def _record(self, agent, model, event, latency=None, usage=None):
+        with self._lock:
+            m = self._metrics.setdefault(agent, {
+                "calls": 0, "errors": 0, "retries": 0, "fallbacks": 0, "cache_hits": 0,
+                "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "models": {},
+            })
+            if event == "call":
+                m["calls"] += 1
+                m["models"][model] = m["models"].get(model, 0) + 1
+                latency_ms = latency * 1000
+                m["latency_ms_total"] += latency_ms
+                m["latency_ms_max"] = max(m["latency_ms_max"], latency_ms)
+                if usage is not None:
+                    m["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                    m["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            else:
+                m[event] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            report = {}
+            for agent, m in self._metrics.items():
+                avg = m["latency_ms_total"] / m["calls"] if m["calls"] else 0.0
+                report[agent] = {**m, "models": dict(m["models"]), "latency_ms_avg": round(avg, 1)}
+            return report
+
+    def _call(self, model, messages, on_token, timeout):
+        """One request. Returns (text, usage)."""
+        client = self.client().with_options(timeout=timeout)
+        if on_token is None:
+            response = client.chat.completions.create(model=model, messages=messages)
+            return response.choices[0].message.content, response.usage
+
+        parts, usage = [], None
+        stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+        for chunk in stream:
+            x_groq = getattr(chunk, "x_groq", None)
+            if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                usage = x_groq.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                try:
+                    on_token(delta)
+                except Exception as e:
+                    logger.warning(f"LLM token callback failed — {e}")
+        return "".join(parts), usage
+
+    def _complete_with(self, agent, model, messages, on_token, deadline, has_fallback):
+        streamed = []
+        tracked = None
+        if on_token is not None:
+            def tracked(text):
+                streamed.append(True)
+                on_token(text)
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError(f"{agent}: deadline exceeded waiting for {model}")
+
+            # Only with saturation_wait set is a busy model treated as saturated
+            fall_back_when_busy = has_fallback and self.saturation_wait is not None
+            wait = min(self.saturation_wait, remaining) if fall_back_when_busy else remaining
+            model_slot = self._model_slot(model)
+            if not model_slot.acquire(timeout=wait):
+                if fall_back_when_busy:
+                    raise ModelSaturated(f"{model} has no free slot")
+                raise LLMError(f"{agent}: deadline exceeded waiting for {model}")
+            try:
+                if not self._global_slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    raise LLMError(f"{agent}: deadline exceeded waiting for an LLM slot")
+                try:
+                    started = time.monotonic()
+                    text, usage = self._call(model, messages, tracked, max(0.1, deadline - started))
+                    self._record(agent, model, "call", latency=time.monotonic() - started, usage=usage)
+                    return text
+                finally:
+                    self._global_slots.release()
+            except RateLimitError as e:
+                self._record(agent, model, "errors")
+                if has_fallback:
+                    raise ModelSaturated(f"{model} rate limited") from e
+                delay = _retry_after(e) or self.backoff * (2 ** attempt)
+                error = e
+            except RETRYABLE_ERRORS as e:
+                self._record(agent, model, "errors")
+                delay = self.backoff * (2 ** attempt)
+                error = e
+            finally:
+                model_slot.release()
+
+            # Tokens already reached the client: retrying would duplicate them
+            if streamed or attempt == self.max_retries:
+                raise error
+            delay = min(delay, max(0.0, deadline - time.monotonic()))
+            logger.warning(f"LLM gateway: {agent} call to {model} failed ({error}), retrying in {delay:.1f}s")
+            self._record(agent, model, "retries")
+            time.sleep(delay)
+
+    @staticmethod
+    def cache_key(model: str, messages: list) -> str:
+        """Content address of a request: instructions and payload are both in messages."""
+        payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+        return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def complete(self, agent: str, model: str, messages: list, on_token=None, timeout=None,
+                 use_cache: bool = True) -> str:
+        """
+        Run a chat completion for `agent` and return the full text.
+        If on_token is given, the response is streamed and on_token(text) is
+        called for every delta as it arrives.
+        use_cache=False bypasses the response cache lookup (the fresh answer
+        is still stored).
+        """
+        key = self.cache_key(model, messages) if self.cache is not None else None
+        if key is not None and use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._record(agent, model, "cache_hits")
+                if on_token is not None:
+                    on_token(cached)
+                return cached
+
+        deadline = time.monotonic() + (timeout or self.timeout)
+        candidates = [model] + [m for m in self.fallbacks.get(model, []) if m != model]
+        for i, candidate in enumerate(candidates):
+            has_fallback = i < len(candidates) - 1
+            try:
+                text = self._complete_with(agent, candidate, messages, on_token, deadline, has_fallback)
+                if key is not None and text:
+                    # Keyed by the model that answered: a fallback answer must not be
+                    # served for the requested model once it is available again
+                    answered = key if candidate == model else self.cache_key(candidate, messages)
+                    self.cache.set(answered, text, ttl=self.cache_ttl)
+                return text
+            except ModelSaturated as e:
+                self._record(agent, candidate, "fallbacks")
+                logger.warning(f"LLM gateway: {e}, falling back to {candidates[i + 1]} for {agent}")
+        raise LLMError(f"{agent}: no model available")
+
+    def cache_stats(self) -> dict | None:
+        return self.cache.stats() if self.cache is not None else None
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """
+    Return the process-wide LLMGateway, configured from env:
+    LLM_MAX_CONCURRENCY, LLM_MODEL_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES,
+    LLM_SATURATION_WAIT (unset: wait for the requested model), and for the response cache LLM_CACHE_BACKEND (sqlite|memory|off),
+    LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL.
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            backend = os.environ.get("LLM_CACHE_BACKEND", "sqlite")
+            cache = None
+            if backend != "off":
+                cache = create_cache(
+                    backend=backend,
+                    path=os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite")),
+                    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000)),
+                )
+            saturation_wait = os.environ.get("LLM_SATURATION_WAIT")
+            _gateway = LLMGateway(
+                cache=cache,
+                cache_ttl=float(os.environ.get("LLM_CACHE_TTL", 1800)),
+                max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 8)),
+                model_concurrency=int(os.environ.get("LLM_MODEL_CONCURRENCY", 4)),
+                timeout=float(os.environ.get("LLM_TIMEOUT", 60)),
+                max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+                saturation_wait=float(saturation_wait) if saturation_wait else None,
+            )
+        return _gateway
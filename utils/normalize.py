@@ -0,0 +1,154 @@
+# utils/normalize.py
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from utils.ohlcv_store import get_ohlcv_store
+
+
+OHLCV_FIELDS = ("open", "high", "low", "close", "volume")
+
+# Daily bars read from the OHLCV store per symbol (~3 years)
+DEFAULT_LOOKBACK_BARS = 756
+
+
+class SymbolRecord:
+    """
+    Compact, array-backed view of everything crawled for one symbol.
+    - dates: datetime64[D] array (ascending)
+    - open/high/low/close/volume: float64 arrays aligned with dates
+    - quotes: latest price per quote source, e.g. {"yahoo": 187.2}
+    - change_pct: latest daily change reported by a quote source, if any
+    """
+
+    def __init__(self, symbol, dates=None, ohlcv=None, quotes=None, change_pct=None):
+        self.symbol = symbol
+        self.dates = dates if dates is not None else np.array([], dtype="datetime64[D]")
+        ohlcv = ohlcv or {}
+        for field in OHLCV_FIELDS:
+            setattr(self, field, ohlcv.get(field, np.array([], dtype=np.float64)))
+        self.quotes = quotes or {}
+        self.change_pct = change_pct
+
+    def __len__(self):
+        return len(self.dates)
+
+    def has_history(self) -> bool:
+        return len(self.dates) > 0
+
+    def frame(self) -> pd.DataFrame:
+        """OHLCV as a DataFrame indexed by date."""
+        return pd.DataFrame(
+            {field: getattr(self, field) for field in OHLCV_FIELDS},
+            index=pd.DatetimeIndex(self.dates),
+        )
+
+    def fingerprint(self, decimals: int = 2) -> str:
+        """
+        Content hash of the normalized data, rounded to the precision sent to
+        the LLM, so two crawls fingerprint alike unless the numbers moved.
+        """
+        h = hashlib.sha256(self.symbol.encode("utf-8"))
+        h.update(self.dates.astype("datetime64[D]").astype(np.int64).tobytes())
+        for field in OHLCV_FIELDS:
+            h.update(np.round(getattr(self, field), decimals).tobytes())
+        # One price per symbol, whichever source answered: a hedged crawl may
+        # get it from a different provider each time
+        quote = round(float(np.median(list(self.quotes.values()))), decimals) if self.quotes else None
+        change = None if self.change_pct is None else round(self.change_pct, decimals)
+        h.update(repr((quote, change)).encode("utf-8"))
+        return h.hexdigest()
+
+    def last_price(self):
+        if self.has_history():
+            return float(self.close[-1])
+        for source in ("yahoo", "finnhub", "google_finance"):
+            if source in self.quotes:
+                return self.quotes[source]
+        return None
+
+
+def alpha_vantage_arrays(payload):
+    """Turn the nested "1. open" keyed daily series into dates + OHLCV arrays."""
+    if not isinstance(payload, dict):
+        return None, None
+    series = payload.get("Time Series (Daily)")
+    if not series:
+        return None, None
+    days = sorted(series)
+    dates = np.array(days, dtype="datetime64[D]")
+    ohlcv = {}
+    for field in OHLCV_FIELDS:
+        key = next((k for k in series[days[0]] if k.endswith(field)), None)
+        ohlcv[field] = np.array(
+            [float(series[d][key]) if key else np.nan for d in days], dtype=np.float64
+        )
+    return dates, ohlcv
+
+
+def _history_arrays(symbol, payload, lookback):
+    """Daily bars from the OHLCV store when the crawl points there, else from the raw JSON."""
+    if isinstance(payload, dict) and payload.get("ohlcv_store"):
+        return get_ohlcv_store().read(symbol, lookback=lookback)
+    return alpha_vantage_arrays(payload)
+
+
+def normalize_symbol(symbol: str, sources: dict, lookback: int | None = None) -> SymbolRecord:
+    """
+    Merge every source crawled for one symbol into a SymbolRecord.
+    History is read from the OHLCV store (last `lookback` bars, default
+    OHLCV_LOOKBACK_BARS) when the crawler stored it there.
+    """
+    if lookback is None:
+        lookback = int(os.environ.get("OHLCV_LOOKBACK_BARS", DEFAULT_LOOKBACK_BARS))
+    dates, ohlcv = _history_arrays(symbol, sources.get("alpha_vantage"), lookback)
+    quotes, change_pct = {}, None
+
+    if sources.get("yahoo") and sources["yahoo"].get("close") is not None:
+        quotes["yahoo"] = round(float(sources["yahoo"]["close"]), 4)
+    finnhub = sources.get("finnhub")
+    if finnhub and finnhub.get("c"):
+        quotes["finnhub"] = float(finnhub["c"])
+        if finnhub.get("dp") is not None:
+            change_pct = float(finnhub["dp"])
+    if sources.get("google_finance") and sources["google_finance"].get("close") is not None:
+        quotes["google_finance"] = float(sources["google_finance"]["close"])
+
+    return SymbolRecord(symbol, dates=dates, ohlcv=ohlcv, quotes=quotes, change_pct=change_pct)
+
+
+def normalize_market_data(market_data: dict) -> dict:
+    """Normalize crawler output ({symbol: {source: data}}) into {symbol: SymbolRecord}."""
+    return {symbol: normalize_symbol(symbol, sources or {}) for symbol, sources in market_data.items()}
+
+
+def _fmt(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}" if abs(value) < 1e6 else f"{value:.0f}"
+    return str(value)
+
+
+def serialize_records(records: dict, last_bars: int = 5) -> str:
+    """
+    Dense, CSV-like prompt encoding of normalized records:
+    one row per quote and one row per recent daily bar.
+    """
+    quote_rows = ["symbol,source,price,chg_pct"]
+    bar_rows = ["symbol,date,open,high,low,close,volume"]
+    for symbol, record in records.items():
+        for source, price in record.quotes.items():
+            chg = record.change_pct if source == "finnhub" else None
+            quote_rows.append(",".join([symbol, source, _fmt(price), _fmt(chg)]))
+        for i in range(max(0, len(record) - last_bars), len(record)):
+            bar_rows.append(",".join(
+                [symbol, str(record.dates[i])] + [_fmt(float(getattr(record, f)[i])) for f in OHLCV_FIELDS]
+            ))
+
+    sections = []
+    if len(quote_rows) > 1:
+        sections.append("Latest quotes:\n" + "\n".join(quote_rows))
+    if len(bar_rows) > 1:
+        sections.append(f"Recent daily bars (last {last_bars}):\n" + "\n".join(bar_rows))
+    return "\n\n".join(sections)
@@ -0,0 +1,139 @@
+# utils/ohlcv_store.py
+import os
+import re
+import threading
+import numpy as np
+from utils.logging import logger
+
+
+OHLCV_DTYPE = np.dtype([
+    ("date", "datetime64[D]"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+])
+
+# Alpha Vantage outputsize=compact returns the latest 100 daily bars
+COMPACT_BARS = 100
+
+
+def latest_session(today=None) -> np.datetime64:
+    """Most recent weekday before today: the last daily bar that should be final."""
+    today = np.datetime64(today or "today", "D")
+    return np.busday_offset(today, -1, roll="forward")
+
+
+def missing_sessions(last_date, today=None) -> int:
+    """Weekdays between the last stored bar and today (holidays are not excluded)."""
+    return int(np.busday_count(np.datetime64(last_date, "D") + 1, np.datetime64(today or "today", "D")))
+
+
+class OHLCVStore:
+    """
+    Daily OHLCV bars per symbol, one structured NumPy file per symbol
+    (<root>/<SYMBOL>.npy, sorted by date). Reads are memory-mapped, so long
+    histories cost no parsing; writes merge new bars in and replace the
+    file atomically. Bars for dates already stored are overwritten. Only
+    finished sessions belong here: the crawler drops bars dated today, so a
+    partial intraday bar is never served as the day's final bar.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^A-Z0-9.\-]", "_", symbol.upper()) + ".npy")
+
+    def _lock(self, symbol: str):
+        with self._locks_guard:
+            return self._locks.setdefault(symbol.upper(), threading.Lock())
+
+    def _load(self, symbol: str):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def read(self, symbol: str, lookback: int | None = None):
+        """
+        Return (dates, {field: array}) for the last `lookback` bars (all if None),
+        or (None, None) if nothing is stored.
+        """
+        bars = self._load(symbol)
+        if bars is None or len(bars) == 0:
+            return None, None
+        if lookback:
+            bars = bars[-lookback:]
+        return np.array(bars["date"]), {f: np.array(bars[f]) for f in OHLCV_DTYPE.names[1:]}
+
+    def last_date(self, symbol: str):
+        bars = self._load(symbol)
+        if bars is None or len(bars) == 0:
+            return None
+        return bars["date"][-1]
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.root) if name.endswith(".npy"))
+
+    def append(self, symbol: str, dates, ohlcv: dict, replace: bool = False) -> int:
+        """
+        Merge bars into the store; returns the number of dates not stored before.
+        replace=True drops the stored bars first (e.g. when the new ones do
+        not connect to them).
+        """
+        if len(dates) == 0:
+            return 0
+        new = np.zeros(len(dates), dtype=OHLCV_DTYPE)
+        new["date"] = dates
+        for field in OHLCV_DTYPE.names[1:]:
+            new[field] = ohlcv.get(field, np.full(len(dates), np.nan))
+
+        with self._lock(symbol):
+            existing = None if replace else self._load(symbol)
+            if existing is not None and len(existing):
+                added = int(np.count_nonzero(~np.isin(new["date"], existing["date"])))
+                keep = np.array(existing[~np.isin(existing["date"], new["date"])])
+                merged = np.concatenate([keep, new])
+            else:
+                added = len(new)
+                merged = new
+            merged = merged[np.argsort(merged["date"], kind="stable")]
+
+            path = self._path(symbol)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, merged)
+            os.replace(tmp, path)
+        return added
+
+    def summary(self, symbol: str) -> dict | None:
+        """Small JSON-able pointer to the stored history, used in crawl results."""
+        bars = self._load(symbol)
+        if bars is None or len(bars) == 0:
+            return None
+        return {
+            "ohlcv_store": True,
+            "first_date": str(bars["date"][0]),
+            "last_date": str(bars["date"][-1]),
+            "bars": int(len(bars)),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_ohlcv_store() -> OHLCVStore:
+    """Return the process-wide OHLCVStore rooted at OHLCV_STORE_PATH (default .cache/ohlcv)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            root = os.environ.get("OHLCV_STORE_PATH", os.path.join(".cache", "ohlcv"))
+            _store = OHLCVStore(root)
+            logger.info(f"OHLCV store at {root}")
+        return _store
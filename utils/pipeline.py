@@ -0,0 +1,200 @@
+# utils/pipeline.py
+import os
+import asyncio
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.logging import logger
+
+
+_MISSING = object()
+
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+
+def get_stage_executor() -> ThreadPoolExecutor:
+    """
+    Process-wide pool for blocking stage work (PIPELINE_STAGE_WORKERS threads).
+    Unlike the loop's default executor it is not joined when asyncio.run()
+    returns, so a timed-out call cannot hold the run past its timeout.
+    """
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(
+                max_workers=int(os.environ.get("PIPELINE_STAGE_WORKERS", 32)),
+                thread_name_prefix="pipeline-stage",
+            )
+        return _stage_executor
+
+
+async def run_blocking(func, *args):
+    """Await func(*args) on the stage executor (use instead of asyncio.to_thread in stages)."""
+    return await asyncio.get_running_loop().run_in_executor(get_stage_executor(), func, *args)
+
+
+class StageError(Exception):
+    """Raised when a stage fails after exhausting its retries."""
+
+    def __init__(self, stage, error):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class PipelineCancelled(Exception):
+    """Raised when a run is cancelled; takes effect at the next stage boundary."""
+
+
+class Stage:
+    """
+    One node of a pipeline graph.
+    - func(results) receives the dict of completed stage outputs and may be
+      sync (run on the stage executor) or async.
+    - deps: names of stages whose outputs func needs.
+    - timeout: seconds per attempt; retries: extra attempts after a failure,
+      with exponential backoff starting at `backoff` seconds. A timed-out
+      attempt is not retried: its thread cannot be stopped and would still
+      be running alongside the retry.
+    - failed_if(value): optional predicate marking a returned value as a
+      failure, e.g. agents that report errors as "Error: ..." text.
+    - default: value used if the stage still fails (otherwise the run fails).
+    """
+
+    def __init__(self, name, func, deps=(), timeout=None, retries=0, backoff=1.0, default=_MISSING,
+                 failed_if=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.default = default
+        self.failed_if = failed_if
+
+
+class PipelineGraph:
+    """
+    Declarative stage graph run on asyncio. Every stage starts as soon as
+    its dependencies are done, so independent stages overlap and total
+    latency follows the critical path.
+    on_event(stage, status, value) is called with status "started",
+    "retrying", "completed", "failed" or "cancelled".
+    Setting cancel_event (a threading.Event) stops the run before the next
+    stage or retry starts; stages already running finish their current call.
+    """
+
+    def __init__(self, stages, on_event=None, cancel_event=None):
+        self.stages = {s.name: s for s in stages}
+        self.on_event = on_event
+        self.cancel_event = cancel_event
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline graph has a cycle at '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown pipeline stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _emit(self, stage, status, value=None):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(stage, status, value)
+        except Exception as e:
+            logger.warning(f"Pipeline: event callback failed for {stage} — {e}")
+
+    async def _attempt(self, stage, results):
+        if inspect.iscoroutinefunction(stage.func):
+            work = stage.func(results)
+        else:
+            work = run_blocking(stage.func, results)
+        if stage.timeout:
+            value = await asyncio.wait_for(work, stage.timeout)
+        else:
+            value = await work
+        if stage.failed_if is not None and stage.failed_if(value):
+            raise RuntimeError(f"stage returned an error: {str(value)[:200]}")
+        return value
+
+    def _check_cancelled(self, stage):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self._emit(stage.name, "cancelled")
+            raise PipelineCancelled(f"Pipeline cancelled before stage '{stage.name}'")
+
+    async def _run_stage(self, stage, results, tasks):
+        if stage.deps:
+            await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+
+        self._check_cancelled(stage)
+        self._emit(stage.name, "started")
+        started = time.monotonic()
+        for attempt in range(stage.retries + 1):
+            if attempt:
+                self._check_cancelled(stage)
+            try:
+                value = await self._attempt(stage, results)
+                results[stage.name] = value
+                logger.info(f"Pipeline: stage '{stage.name}' done in {time.monotonic() - started:.2f}s")
+                self._emit(stage.name, "completed", value)
+                return value
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                error = f"timed out after {stage.timeout}s" if timed_out else e
+                if attempt < stage.retries and not timed_out:
+                    delay = stage.backoff * (2 ** attempt)
+                    logger.warning(f"Pipeline: stage '{stage.name}' failed ({error}), retrying in {delay:.1f}s")
+                    self._emit(stage.name, "retrying", str(error))
+                    await asyncio.sleep(delay)
+                    continue
+                logger.error(f"Pipeline: stage '{stage.name}' failed — {error}")
+                self._emit(stage.name, "failed", str(error))
+                if stage.default is not _MISSING:
+                    results[stage.name] = stage.default
+                    return stage.default
+                raise StageError(stage.name, error) from e
+
+    async def run(self, initial=None) -> dict:
+        results = dict(initial or {})
+        tasks = {}
+        for name in self.order:
+            tasks[name] = asyncio.create_task(self._run_stage(self.stages[name], results, tasks))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        return results
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code. If the caller is
+    already inside an event loop thread, run it on a helper thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
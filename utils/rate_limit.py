@@ -0,0 +1,209 @@
+# utils/rate_limit.py
+import os
+import time
+import threading
+from utils.logging import logger
+
+
+# Free-tier ceilings; override with RATE_LIMIT_<PROVIDER>_PER_MINUTE / _PER_DAY
+DEFAULT_PROVIDER_LIMITS = {
+    "alpha_vantage": {"per_minute": 5, "per_day": 25, "burst": 1, "throttle_backoff": 60},
+    "finnhub": {"per_minute": 60, "per_day": None, "burst": 10, "throttle_backoff": 2},
+}
+
+# Keys found in 200 OK Alpha Vantage payloads when the request was throttled
+ALPHA_VANTAGE_THROTTLE_KEYS = ("Note", "Information")
+
+# "Information" messages that retrying cannot fix (premium-only parameter or
+# endpoint, invalid or missing API key): errors, not throttles. Rate limit
+# messages also point at the premium plans, so they are matched first.
+ALPHA_VANTAGE_FATAL_MARKERS = ("premium", "apikey", "api key")
+ALPHA_VANTAGE_RATE_MARKERS = ("rate limit", "call frequency", "requests per")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+    acquire() blocks until a token is available (or the timeout expires)
+    instead of failing, so callers queue up at the provider's rate.
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """Drain the bucket and block it for `seconds` (used after a throttle response)."""
+        with self._lock:
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class QuotaGovernor:
+    """
+    Shares one token bucket per (provider, api_key) across every concurrent
+    request in the process, and tracks the provider's daily quota.
+    """
+
+    def __init__(self, limits: dict | None = None):
+        self.limits = {p: dict(l) for p, l in DEFAULT_PROVIDER_LIMITS.items()}
+        for provider, override in (limits or {}).items():
+            self.limits.setdefault(provider, {}).update(override)
+        self._buckets = {}
+        self._daily = {}  # (provider, key) -> [window_start, count]
+        self._throttles = {}  # (provider, key) -> consecutive throttle responses
+        self._lock = threading.Lock()
+
+    def _limit(self, provider, name):
+        env_value = os.environ.get(f"RATE_LIMIT_{provider.upper()}_{name.upper()}")
+        if env_value is not None:
+            return float(env_value)
+        return self.limits.get(provider, {}).get(name)
+
+    def _bucket(self, provider, api_key) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get((provider, api_key))
+            if bucket is None:
+                per_minute = self._limit(provider, "per_minute") or 60
+                bucket = TokenBucket(per_minute / 60.0, self._limit(provider, "burst") or 1)
+                self._buckets[(provider, api_key)] = bucket
+            return bucket
+
+    def _daily_remaining(self, provider, api_key):
+        per_day = self._limit(provider, "per_day")
+        if per_day is None:
+            return None
+        window = self._daily.get((provider, api_key))
+        if window is None or time.time() - window[0] >= 24 * 60 * 60:
+            return int(per_day)
+        return max(0, int(per_day) - window[1])
+
+    def acquire(self, provider: str, api_key: str, timeout: float | None = None) -> bool:
+        """
+        Wait for a call slot. Returns False if the daily quota is spent or
+        no slot frees up within `timeout` seconds.
+        """
+        if timeout is None:
+            timeout = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 60))
+        with self._lock:
+            if self._daily_remaining(provider, api_key) == 0:
+                logger.warning(f"{provider}: daily quota exhausted")
+                return False
+        if not self._bucket(provider, api_key).acquire(timeout=timeout):
+            logger.warning(f"{provider}: no rate limit slot within {timeout}s")
+            return False
+        with self._lock:
+            window = self._daily.get((provider, api_key))
+            if window is None or time.time() - window[0] >= 24 * 60 * 60:
+                self._daily[(provider, api_key)] = [time.time(), 1]
+            else:
+                window[1] += 1
+        return True
+
+    def report_success(self, provider: str, api_key: str):
+        with self._lock:
+            self._throttles.pop((provider, api_key), None)
+
+    def report_throttled(self, provider: str, api_key: str, retry_after: float | None = None) -> float:
+        """Back off after a throttle response; returns the backoff applied in seconds."""
+        with self._lock:
+            strikes = self._throttles.get((provider, api_key), 0)
+            self._throttles[(provider, api_key)] = strikes + 1
+        if retry_after is None:
+            base = self._limit(provider, "throttle_backoff") or 1
+            retry_after = base * (2 ** min(strikes, 4))
+        self._bucket(provider, api_key).penalize(retry_after)
+        logger.warning(f"{provider}: throttled by provider, backing off {retry_after:.0f}s")
+        return retry_after
+
+    def remaining(self, provider: str, api_key: str) -> dict:
+        """Report the remaining quota for one provider/key."""
+        bucket = self._bucket(provider, api_key)
+        with self._lock:
+            daily_remaining = self._daily_remaining(provider, api_key)
+        return {
+            "provider": provider,
+            "tokens_available": round(bucket.available(), 2),
+            "per_minute": self._limit(provider, "per_minute"),
+            "daily_remaining": daily_remaining,
+            "blocked_for": round(max(0.0, bucket.blocked_until - time.monotonic()), 1),
+        }
+
+    def report(self) -> list[dict]:
+        """Remaining quota for every provider/key seen so far (keys are masked)."""
+        with self._lock:
+            pairs = list(self._buckets)
+        return [
+            {**self.remaining(provider, key), "key": f"...{key[-4:]}" if key else None}
+            for provider, key in pairs
+        ]
+
+
+def alpha_vantage_error(payload) -> str | None:
+    """Return the message of a non-retryable Alpha Vantage 200 payload, if it is one."""
+    if not isinstance(payload, dict):
+        return None
+    if "Error Message" in payload:
+        return payload["Error Message"]
+    message = str(payload.get("Information", ""))
+    lowered = message.lower()
+    if any(marker in lowered for marker in ALPHA_VANTAGE_RATE_MARKERS):
+        return None
+    if any(marker in lowered for marker in ALPHA_VANTAGE_FATAL_MARKERS):
+        return message
+    return None
+
+
+def is_throttled(provider: str, payload) -> bool:
+    """Detect throttle responses that providers return as regular 200 JSON payloads."""
+    if not isinstance(payload, dict):
+        return False
+    if provider == "alpha_vantage":
+        if alpha_vantage_error(payload):
+            return False
+        return any(k in payload for k in ALPHA_VANTAGE_THROTTLE_KEYS) and not any(
+            k.startswith("Time Series") for k in payload
+        )
+    if provider == "finnhub":
+        return "limit" in str(payload.get("error", "")).lower()
+    return False
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_quota_governor() -> QuotaGovernor:
+    """Return the process-wide QuotaGovernor."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = QuotaGovernor()
+        return _governor
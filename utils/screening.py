@@ -0,0 +1,124 @@
+# utils/screening.py
+import warnings
+import numpy as np
+from utils.indicators import TRADING_DAYS
+
+
+# Metric -> weight in the composite score. Positive weights reward high
+# values, negative weights reward low values.
+DEFAULT_WEIGHTS = {
+    "momentum_3m_pct": 1.0,
+    "vol_ann_pct": -0.5,
+    "dollar_volume_m": 0.5,
+    "max_drawdown_pct": 0.5,  # drawdowns are negative: closer to 0 scores higher
+}
+
+SCREEN_COLUMNS = ["rank", "symbol", "score", "last_close", *DEFAULT_WEIGHTS, "bars"]
+
+MOMENTUM_BARS = 63  # ~3 months
+WINDOW_BARS = 252   # volatility / drawdown window
+LIQUIDITY_BARS = 20
+
+
+def _close_matrix(records: dict, window: int):
+    """
+    Stack the last `window` closes and volumes of every symbol into
+    (n_symbols, window) arrays, right-aligned and NaN-padded.
+    """
+    symbols = list(records)
+    closes = np.full((len(symbols), window), np.nan)
+    volumes = np.full((len(symbols), window), np.nan)
+    for i, sym in enumerate(symbols):
+        record = records[sym]
+        n = min(len(record), window)
+        if n:
+            closes[i, window - n:] = record.close[-n:]
+            volumes[i, window - n:] = record.volume[-n:]
+    return symbols, closes, volumes
+
+
+def screen_metrics(records: dict) -> tuple[list, dict]:
+    """
+    Cross-sectional metrics for every symbol at once ({symbol: SymbolRecord}).
+    Returns (symbols, {metric: array aligned with symbols}).
+    """
+    symbols, closes, volumes = _close_matrix(records, WINDOW_BARS)
+    # Rows without enough history produce all-NaN slices: those metrics stay NaN
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        last = closes[:, -1].copy()
+        momentum = (last / closes[:, -1 - MOMENTUM_BARS] - 1) * 100
+        log_returns = np.diff(np.log(closes), axis=1)
+        vol = np.nanstd(log_returns, axis=1, ddof=1) * np.sqrt(TRADING_DAYS) * 100
+        peaks = np.fmax.accumulate(closes, axis=1)
+        drawdown = np.nanmin(closes / peaks - 1, axis=1) * 100
+        dollar_volume = np.nanmedian(
+            closes[:, -LIQUIDITY_BARS:] * volumes[:, -LIQUIDITY_BARS:], axis=1
+        ) / 1e6
+    metrics = {
+        "last_close": last,
+        "momentum_3m_pct": momentum,
+        "vol_ann_pct": vol,
+        "dollar_volume_m": dollar_volume,
+        "max_drawdown_pct": drawdown,
+        "bars": np.count_nonzero(~np.isnan(closes), axis=1),
+    }
+    # Symbols with a quote but no history still get a last price
+    for i, sym in enumerate(symbols):
+        if np.isnan(metrics["last_close"][i]):
+            price = records[sym].last_price()
+            if price is not None:
+                metrics["last_close"][i] = price
+    return symbols, metrics
+
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    """Cross-sectional z-score clipped to +/-3; NaN where the metric is missing."""
+    finite = np.isfinite(values)
+    z = np.full(values.shape, np.nan)
+    if finite.any():
+        std = values[finite].std()
+        z[finite] = np.clip((values[finite] - values[finite].mean()) / std, -3, 3) if std > 0 else 0.0
+    return z
+
+
+def screen(records: dict, top_n: int, weights: dict | None = None) -> dict:
+    """
+    Rank symbols by a weighted sum of z-scored momentum, volatility,
+    liquidity and drawdown. Returns
+    {"selected": top_n symbols, "ranked": all symbols best first, "table": CSV}.
+    """
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    symbols, metrics = screen_metrics(records)
+    score = np.zeros(len(symbols))
+    for metric, weight in weights.items():
+        z = _zscore(metrics[metric])
+        # A missing metric counts as the worst possible value
+        score += np.where(np.isnan(z), -3.0 * abs(weight), weight * z)
+    # Symbols without any history sort last
+    score = np.where(metrics["bars"] > 1, score, -np.inf)
+    order = np.argsort(-score, kind="stable")
+    ranked = [symbols[i] for i in order]
+
+    rows = [",".join(SCREEN_COLUMNS)]
+    for rank, i in enumerate(order, start=1):
+        values = [rank, symbols[i], score[i]] + [metrics[m][i] for m in SCREEN_COLUMNS[3:]]
+        rows.append(",".join(_fmt(v) for v in values))
+    return {"selected": ranked[:top_n], "ranked": ranked, "table": "\n".join(rows)}
+
+
+def to_markdown(table: str) -> str:
+    """Render the CSV screening table as a Markdown table."""
+    lines = table.splitlines()
+    header = lines[0].split(",")
+    rows = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    rows += ["| " + " | ".join(line.split(",")) + " |" for line in lines[1:]]
+    return "\n".join(rows)
+
+
+def _fmt(value) -> str:
+    if isinstance(value, (float, np.floating)):
+        if not np.isfinite(value):
+            return ""
+        return f"{value:.2f}"
+    return str(value)
@@ -0,0 +1,121 @@
+# utils/symbol_gate.py
+import os
+import re
+import threading
+from utils.logging import logger
+from utils.cache import MemoryCache
+from utils.ticker_index import get_ticker_index
+
+
+# Uppercase words that show up in financial text but are not tickers worth crawling.
+# Only applied to candidates scraped from free text (see drop_stopwords): a
+# structured answer or an explicit list naming AI, ON or IT means the ticker.
+SYMBOL_STOPWORDS = {
+    "A", "I", "AI", "AM", "AN", "AND", "API", "ARE", "AT", "BUY", "BY", "CEO", "CFO", "COO", "CTO", "DATE",
+    "EBIT", "EBITDA", "EPS", "ESG", "ETF", "ETFS", "EU", "EUR", "FAQ", "FED", "FOR", "FY", "GDP", "HOLD",
+    "INC", "IPO", "IS", "IT", "LLC", "LTD", "NAV", "NASDAQ", "NEWS", "NOTE", "NYSE", "OF", "ON", "OR",
+    "OTC", "PE", "PLC", "Q1", "Q2", "Q3", "Q4", "QOQ", "ROE", "ROI", "SEC", "SELL", "THE", "TO", "TTM",
+    "UK", "US", "USA", "USD", "YOY", "YTD", "AMEX", "CORP", "CPI", "IMF", "OPEC", "LAST", "UPDATED",
+}
+
+SYMBOL_PATTERN = re.compile(r"^[A-Z]{1,5}([.\-][A-Z]{1,2})?$")
+
+
+def normalize_symbol(raw) -> str:
+    """Upper-case, strip "$" and spell class shares with a dot (BRK-B, BRK/B -> BRK.B)."""
+    sym = str(raw).strip().upper().lstrip("$")
+    return re.sub(r"^([A-Z]{1,5})[\-/]([A-Z]{1,2})$", r"\1.\2", sym)
+
+
+def drop_stopwords(candidates, index=None) -> list:
+    """
+    Filter uppercase words scraped from free text (search snippets, LLM
+    prose): drop stopwords (CEO, USA, ETF, ...) unless the ticker index
+    lists them.
+    """
+    index = index if index is not None else get_ticker_index()
+    return [sym for sym in candidates if sym not in SYMBOL_STOPWORDS or sym in index]
+
+
+class SymbolValidator:
+    """
+    Pre-crawl gate for candidate symbols. In one pass over the list it:
+    - normalizes case and the class-share separator (BRK-B -> BRK.B) and
+      maps renamed symbols (FB -> META) via the ticker index,
+    - drops malformed symbols (stopwords are only filtered out of text
+      scraped by the resolver, see drop_stopwords),
+    - drops symbols in the negative cache (recently crawled with no data),
+      unless skip_negative is set,
+    - in strict mode, drops anything the ticker index does not know.
+    Symbols the index knows are never negatively cached. A provider saying
+    the symbol does not exist keeps it out for negative_ttl; an empty crawl
+    without such a signal (deadline, throttling) only for short_ttl.
+    """
+
+    def __init__(self, index=None, negative_ttl: float = 24 * 3600, strict: bool = False, max_entries: int = 4096,
+                 short_ttl: float = 15 * 60):
+        self.index = index if index is not None else get_ticker_index()
+        self.strict = strict
+        self.short_ttl = short_ttl
+        self.negative = MemoryCache(max_entries=max_entries, default_ttl=negative_ttl)
+
+    def validate(self, symbols, skip_negative: bool = False) -> tuple[list, dict]:
+        """Return (valid symbols in order, {rejected symbol: reason}), both normalized."""
+        valid, rejected = [], {}
+        for raw in symbols:
+            sym = normalize_symbol(raw)
+            known = self.index.lookup_symbol(sym) if sym else None
+            if known and known[1] == "renamed":
+                logger.info(f"SymbolValidator: {sym} is now {known[0]}")
+                sym, known = known[0], (known[0], "exact")
+            is_known = known is not None and known[1] == "exact"
+
+            if not SYMBOL_PATTERN.match(sym):
+                rejected[sym or str(raw)] = "malformed"
+            elif not is_known and not skip_negative and self.negative.get(sym) is not None:
+                rejected[sym] = "no data recently"
+            elif self.strict and not is_known:
+                rejected[sym] = "unknown"
+            elif sym not in valid:
+                valid.append(sym)
+        if rejected:
+            logger.info(f"SymbolValidator: dropped {rejected}")
+        return valid, rejected
+
+    def mark_invalid(self, symbols, definite: bool = True):
+        """
+        Remember symbols that produced no data so later runs skip them:
+        for the full TTL when a provider reported them as unknown, for
+        short_ttl otherwise.
+        """
+        ttl = None if definite else self.short_ttl
+        for sym in symbols:
+            sym = normalize_symbol(sym)
+            if sym not in self.index:
+                self.negative.set(sym, True, ttl=ttl)
+                reason = "not found" if definite else "no data"
+                logger.info(f"SymbolValidator: {sym} added to the negative cache ({reason})")
+
+    def stats(self) -> dict:
+        return {"strict": self.strict, "negative_cache": self.negative.stats()}
+
+
+_validator = None
+_validator_lock = threading.Lock()
+
+
+def get_symbol_validator() -> SymbolValidator:
+    """
+    Return the process-wide SymbolValidator, configured from env:
+    SYMBOL_VALIDATION (lenient|strict), SYMBOL_NEGATIVE_TTL and
+    SYMBOL_NEGATIVE_SHORT_TTL (seconds).
+    """
+    global _validator
+    with _validator_lock:
+        if _validator is None:
+            _validator = SymbolValidator(
+                negative_ttl=float(os.environ.get("SYMBOL_NEGATIVE_TTL", 24 * 3600)),
+                strict=os.environ.get("SYMBOL_VALIDATION", "lenient") == "strict",
+                short_ttl=float(os.environ.get("SYMBOL_NEGATIVE_SHORT_TTL", 15 * 60)),
+            )
+        return _validator
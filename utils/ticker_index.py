@@ -0,0 +1,215 @@
+# utils/ticker_index.py
+import os
+import re
+import csv
+import bisect
+import difflib
+import threading
+from utils.logging import logger
+
+
+DEFAULT_LISTING_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "symbols.csv")
+
+# Symbols that changed after a rename or merger: old -> current
+DEFAULT_RENAMES = {
+    "FB": "META",
+    "SQ": "XYZ",
+    "FISV": "FI",
+    "ANTM": "ELV",
+    "ABC": "COR",
+    "RTN": "RTX",
+    "UTX": "RTX",
+    "PCLN": "BKNG",
+    "HFC": "DINO",
+    "COG": "CTRA",
+    "DISCA": "WBD",
+    "DISCK": "WBD",
+    "VIAC": "PARA",
+    "CBS": "PARA",
+    "SYMC": "GEN",
+    "NLOK": "GEN",
+    "FLT": "CPAY",
+    "PKI": "RVTY",
+    "RE": "EG",
+    "PEAK": "DOC",
+    "KIND": "NXDR",
+}
+
+# Words dropped from company names before indexing and lookup
+NAME_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "companies", "ltd", "limited",
+    "plc", "group", "holdings", "holding", "lp", "llc", "sa", "se", "nv", "ag", "asa", "the", "class",
+}
+
+# Sector / theme words that must go through the full resolver, never a name prefix
+GENERIC_WORDS = {
+    "gold", "silver", "oil", "gas", "energy", "bank", "banks", "tech", "technology", "mining", "miners",
+    "financial", "health", "healthcare", "pharma", "retail", "auto", "steel", "solar", "real", "united",
+    "american", "general", "international", "first", "global", "national", "southern",
+}
+
+TICKER_PATTERN = re.compile(r"^[A-Za-z]{1,5}([.\-][A-Za-z]{1,2})?$")
+
+
+def normalize_name(name: str) -> str:
+    words = re.sub(r"[^a-z0-9 ]+", " ", name.lower().replace("&", " and ")).split()
+    return " ".join(w for w in words if w not in NAME_SUFFIXES)
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if b is a one-character substitution, insertion, deletion or adjacent swap of a."""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return a == b
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    short, long = (a, b) if len(a) < len(b) else (b, a)
+    return any(long[:i] + long[i + 1:] == short for i in range(len(long)))
+
+
+class TickerIndex:
+    """
+    In-memory symbol / company-name index built from a listing file.
+    - lookup_symbol: exact symbols, renamed symbols (FB -> META) and, when
+      the listing is complete (a full exchange file), one-edit typos
+      (APPL -> AAPL). Against a partial list a real ticker that is missing
+      from it would be "corrected" to a neighbour (AMC -> AMD), so typos
+      are only corrected with complete=True.
+    - lookup_name: company names, exact first, then by normalized prefix
+      ("apple" -> AAPL, "ge" -> GE rather than GEV), then by fuzzy match.
+    """
+
+    def __init__(self, listings: dict, renames: dict = None, complete: bool = False):
+        self.names = {sym.upper(): name for sym, name in listings.items()}
+        self.complete = complete
+        self.renames = {old.upper(): new.upper() for old, new in (DEFAULT_RENAMES if renames is None else renames).items()}
+        self._by_length = {}
+        for sym in self.names:
+            self._by_length.setdefault(len(sym), []).append(sym)
+        # Sorted (normalized name, symbol) pairs for prefix search with bisect
+        self._sorted_names = sorted(
+            (normalize_name(name), sym) for sym, name in self.names.items() if normalize_name(name)
+        )
+        self._name_keys = [n for n, _ in self._sorted_names]
+
+    @classmethod
+    def from_file(cls, path: str, renames: dict = None, complete: bool = None) -> "TickerIndex":
+        """
+        Load a listing file: CSV with symbol,name columns, or a NASDAQ Trader
+        pipe-delimited file (Symbol|Security Name|...). Unless told otherwise,
+        only NASDAQ Trader files count as complete listings.
+        """
+        listings = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            header = f.readline()
+            delimiter = "|" if "|" in header else ","
+            f.seek(0)
+            for row in csv.DictReader(f, delimiter=delimiter):
+                row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+                symbol = row.get("symbol") or row.get("act symbol") or row.get("ticker")
+                name = row.get("name") or row.get("security name") or ""
+                if symbol and not symbol.startswith("File Creation Time"):
+                    listings[symbol] = name
+        return cls(listings, renames, complete=delimiter == "|" if complete is None else complete)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self.names
+
+    def lookup_symbol(self, token: str):
+        """Return (symbol, reason) with reason "exact", "renamed" or "typo", or None."""
+        token = token.strip().upper()
+        if not token:
+            return None
+        if token in self.names:
+            return token, "exact"
+        if token in self.renames:
+            return self.renames[token], "renamed"
+        if not self.complete or len(token) < 3:
+            return None  # partial listing, or too short to correct safely
+        candidates = [
+            sym
+            for length in (len(token) - 1, len(token), len(token) + 1)
+            for sym in self._by_length.get(length, [])
+            if _within_one_edit(token, sym)
+        ]
+        if not candidates:
+            return None
+        best = max(candidates, key=lambda s: (s[0] == token[0], sorted(s) == sorted(token),
+                                              difflib.SequenceMatcher(None, token, s).ratio()))
+        return best, "typo"
+
+    def lookup_name(self, text: str, cutoff: float = 0.85):
+        """Return the symbol whose company name best matches text, or None."""
+        key = normalize_name(text)
+        if not key or key in GENERIC_WORDS:
+            return None
+        i = bisect.bisect_left(self._name_keys, key)
+        matches = []
+        while i < len(self._name_keys) and self._name_keys[i].startswith(key):
+            name = self._name_keys[i]
+            if len(name) == len(key) or name[len(key)] == " ":
+                matches.append(self._sorted_names[i])
+            i += 1
+        if matches:
+            exact = [sym for name, sym in matches if name == key]
+            if exact:
+                return min(exact, key=lambda sym: (sym != key.upper(), len(sym), sym))
+            # "ge" names both GE Aerospace and GE Vernova: the symbol spelled like the query wins
+            for _, sym in matches:
+                if sym == key.upper():
+                    return sym
+            return min(matches, key=lambda m: (len(m[0]), len(m[1]), m[1]))[1]
+        close = difflib.get_close_matches(key, self._name_keys, n=1, cutoff=cutoff)
+        if close:
+            return self._sorted_names[bisect.bisect_left(self._name_keys, close[0])][1]
+        return None
+
+    def resolve_token(self, token: str):
+        """
+        Resolve one user-supplied item (ticker or company name).
+        Returns (symbol, reason) or None.
+        """
+        token = token.strip()
+        looks_like_ticker = bool(TICKER_PATTERN.match(token))
+        if looks_like_ticker and token.isupper():
+            found = self.lookup_symbol(token)
+            if found:
+                return found
+        symbol = self.lookup_name(token)
+        if symbol:
+            return symbol, "name"
+        # Lower-case words are names first ("apple"); only exact / renamed symbols otherwise
+        if looks_like_ticker and not token.isupper() and token.lower() not in GENERIC_WORDS:
+            found = self.lookup_symbol(token)
+            if found and found[1] != "typo":
+                return found
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_ticker_index() -> TickerIndex:
+    """
+    Return the process-wide TickerIndex, loaded from TICKER_LISTING_PATH.
+    TICKER_LISTING_COMPLETE=1/0 overrides whether the file is treated as a
+    full exchange listing (enables typo correction).
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = os.environ.get("TICKER_LISTING_PATH", DEFAULT_LISTING_PATH)
+            complete = os.environ.get("TICKER_LISTING_COMPLETE")
+            try:
+                _index = TickerIndex.from_file(path, complete=None if complete is None else complete == "1")
+                logger.info(f"TickerIndex: loaded {len(_index)} symbols from {path}")
+            except OSError as e:
+                logger.warning(f"TickerIndex: cannot read {path} ({e}), using renames only")
+                _index = TickerIndex({})
+        return _index
@@ -1,26 +1,61 @@
 # utils/utils.py
-import requests
-import yfinance as yf
 import re
 from utils.logging import logger
+from utils.http_client import http_get
+from utils.rate_limit import get_quota_governor, is_throttled, alpha_vantage_error
+from utils.chunking import chunk_text, chunk_sections, TokenCounter  # re-exported for agents
+
+
+# How many times a throttled call is retried after backing off
+THROTTLE_RETRIES = 2
+
+# Finnhub answers an unknown symbol with a quote whose price fields are all zero
+FINNHUB_PRICE_FIELDS = ("c", "h", "l", "o", "pc")
+
+
+class SymbolNotFound(Exception):
+    """The provider definitely does not know the symbol (not a transient failure)."""
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
 
 
 def alpha_vantage_search(api_key, keyword):
     """
     Search for ticker symbols on Alpha Vantage by keyword.
+    Paced and backed off by the shared quota governor like alpha_vantage_api_call.
     """
     if not api_key:
         return []
+    governor = get_quota_governor()
     try:
         url = "https://www.alphavantage.co/query"
         params = {"function": "SYMBOL_SEARCH", "keywords": keyword, "apikey": api_key}
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        return [
-            {"symbol": m.get("1. symbol"), "name": m.get("2. name")}
-            for m in data.get("bestMatches", [])
-        ]
+        for _ in range(THROTTLE_RETRIES + 1):
+            if not governor.acquire("alpha_vantage", api_key):
+                logger.warning(f"Alpha Vantage quota unavailable, skipping search for '{keyword}'")
+                return []
+            resp = http_get(url, params=params)
+            resp.raise_for_status()
+            data = resp.json()
+            if is_throttled("alpha_vantage", data):
+                governor.report_throttled("alpha_vantage", api_key)
+                continue
+            governor.report_success("alpha_vantage", api_key)
+            error = alpha_vantage_error(data)
+            if error:
+                logger.warning(f"Alpha Vantage search error for '{keyword}': {error}")
+                return []
+            return [
+                {"symbol": m.get("1. symbol"), "name": m.get("2. name")}
+                for m in data.get("bestMatches", [])
+            ]
+        logger.warning(f"Alpha Vantage still throttled for search '{keyword}', giving up")
+        return []
     except Exception as e:
         logger.warning(f"Alpha Vantage search failed: {e}")
         return []
@@ -33,7 +68,7 @@ def yahoo_autocomplete(query):
     try:
         url = "https://query1.finance.yahoo.com/v1/finance/search"
         params = {"q": query, "quotesCount": 10, "newsCount": 0}
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         resp.raise_for_status()
         data = resp.json()
         return [
@@ -52,10 +87,16 @@ def finnhub_search(api_key, query):
     """
     if not api_key:
         return []
+    governor = get_quota_governor()
+    if not governor.acquire("finnhub", api_key):
+        return []
     try:
         url = "https://finnhub.io/api/v1/search"
         params = {"q": query, "token": api_key}
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
+        if resp.status_code == 429:
+            governor.report_throttled("finnhub", api_key, retry_after=_retry_after(resp))
+            return []
         resp.raise_for_status()
         data = resp.json()
         return [
@@ -74,7 +115,7 @@ def fetch_google_finance(symbol):
     try:
         url = f"https://www.google.com/finance/quote/{symbol}:NASDAQ"
         headers = {"User-Agent": "Mozilla/5.0"}
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = http_get(url, headers=headers)
         if resp.status_code != 200:
             return None
         match = re.search(r'"price":([0-9.]+)', resp.text)
@@ -90,6 +131,8 @@ def fetch_yahoo_finance(symbol):
     """
     Fetch latest price from Yahoo Finance using yfinance.
     """
+    import yfinance as yf  # heavy; only loaded once a crawl needs it
+
     try:
         ticker = yf.Ticker(symbol)
         hist = ticker.history(period="1d")
@@ -101,26 +144,128 @@ def fetch_yahoo_finance(symbol):
         return None
 
 
-def alpha_vantage_api_call(api_key, symbol):
+def download_yahoo_history(symbols, period="1d"):
+    """
+    Download history for many tickers in one multi-ticker Yahoo request.
+    Returns the columnar DataFrame (dates x (ticker, field)).
+    """
+    import yfinance as yf
+
+    return yf.download(
+        tickers=list(symbols),
+        period=period,
+        group_by="ticker",
+        auto_adjust=False,
+        progress=False,
+        threads=False,
+    )
+
+
+def fetch_yahoo_finance_batch(symbols, period="1d"):
+    """
+    Fetch latest prices for a list of symbols with a single Yahoo request.
+    The frame is only split per symbol at the end; symbols without data are omitted.
+    """
+    import pandas as pd
+
+    symbols = list(symbols)
+    try:
+        frame = download_yahoo_history(symbols, period=period)
+        if frame is None or frame.empty:
+            return {}
+        if isinstance(frame.columns, pd.MultiIndex):
+            closes = frame.xs("Close", axis=1, level=1)
+        else:
+            closes = frame[["Close"]].set_axis(symbols[:1], axis=1)
+        last = closes.ffill().iloc[-1]
+        return {
+            sym: {"close": float(last[sym])}
+            for sym in symbols
+            if sym in last.index and pd.notna(last[sym])
+        }
+    except Exception as e:
+        logger.warning(f"Yahoo Finance batch download failed for {symbols}: {e}")
+        return {}
+
+
+def fetch_yahoo_history_batch(symbols, period="1y"):
+    """
+    Fetch daily OHLCV for a list of symbols with a single Yahoo request.
+    Returns {symbol: (dates, {"open": ..., "volume": ...})} with datetime64[D]
+    dates and float64 arrays; symbols without data are omitted.
+    """
+    import numpy as np
+    import pandas as pd
+
+    symbols = list(symbols)
+    try:
+        frame = download_yahoo_history(symbols, period=period)
+        if frame is None or frame.empty:
+            return {}
+        history = {}
+        for sym in symbols:
+            if isinstance(frame.columns, pd.MultiIndex):
+                if sym not in frame.columns.get_level_values(0):
+                    continue
+                bars = frame[sym]
+            else:
+                bars = frame if sym == symbols[0] else None
+            if bars is None:
+                continue
+            bars = bars.dropna(subset=["Close"])
+            if bars.empty:
+                continue
+            dates = bars.index.values.astype("datetime64[D]")
+            ohlcv = {field.lower(): bars[field].to_numpy(dtype=np.float64)
+                     for field in ("Open", "High", "Low", "Close", "Volume")}
+            history[sym] = (dates, ohlcv)
+        return history
+    except Exception as e:
+        logger.warning(f"Yahoo Finance history download failed for {symbols}: {e}")
+        return {}
+
+
+def alpha_vantage_api_call(api_key, symbol, outputsize="compact"):
     """
     Fetch daily stock data from Alpha Vantage.
+    outputsize: "compact" (latest 100 bars) or "full" (20+ years, premium keys only).
     Returns raw JSON from the API.
+    Calls are paced by the shared quota governor; throttle "Note"/"Information"
+    payloads trigger a backoff and are never returned as data. Errors
+    (unknown symbol, premium-only request, invalid key) are not retried;
+    an unknown symbol ("Error Message") raises SymbolNotFound.
     """
+    governor = get_quota_governor()
     try:
         url = "https://www.alphavantage.co/query"
         params = {
             "function": "TIME_SERIES_DAILY",
             "symbol": symbol,
             "apikey": api_key,
-            "outputsize": "compact"
+            "outputsize": outputsize
         }
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        if "Error Message" in data:
-            logger.warning(f"Alpha Vantage API error for {symbol}: {data['Error Message']}")
-            return None
-        return data
+        for _ in range(THROTTLE_RETRIES + 1):
+            if not governor.acquire("alpha_vantage", api_key):
+                logger.warning(f"Alpha Vantage quota unavailable, skipping {symbol}")
+                return None
+            resp = http_get(url, params=params)
+            resp.raise_for_status()
+            data = resp.json()
+            if is_throttled("alpha_vantage", data):
+                governor.report_throttled("alpha_vantage", api_key)
+                continue
+            governor.report_success("alpha_vantage", api_key)
+            if "Error Message" in data:
+                raise SymbolNotFound(data["Error Message"])
+            error = alpha_vantage_error(data)
+            if error:
+                logger.warning(f"Alpha Vantage API error for {symbol}: {error}")
+                return None
+            return data
+        logger.warning(f"Alpha Vantage still throttled for {symbol}, giving up")
+        return None
+    except SymbolNotFound:
+        raise
     except Exception as e:
         logger.error(f"Alpha Vantage API call failed for {symbol}: {e}")
         return None
@@ -130,37 +275,38 @@ def finnhub_api_call(api_key, symbol):
     """
     Fetch quote data from Finnhub.
     Returns raw JSON from the API.
+    Calls are paced by the shared quota governor and back off on 429s.
+    An all-zero quote (Finnhub's answer for unknown symbols) raises SymbolNotFound.
     """
+    governor = get_quota_governor()
     try:
         url = f"https://finnhub.io/api/v1/quote"
         params = {"symbol": symbol, "token": api_key}
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        return resp.json()
+        for _ in range(THROTTLE_RETRIES + 1):
+            if not governor.acquire("finnhub", api_key):
+                logger.warning(f"Finnhub quota unavailable, skipping {symbol}")
+                return None
+            resp = http_get(url, params=params)
+            if resp.status_code == 429:
+                governor.report_throttled("finnhub", api_key, retry_after=_retry_after(resp))
+                continue
+            resp.raise_for_status()
+            data = resp.json()
+            if is_throttled("finnhub", data):
+                governor.report_throttled("finnhub", api_key)
+                continue
+            governor.report_success("finnhub", api_key)
+            if isinstance(data, dict) and not any(data.get(f) for f in FINNHUB_PRICE_FIELDS):
+                raise SymbolNotFound(f"Finnhub has no quote for {symbol}")
+            return data
+        logger.warning(f"Finnhub still throttled for {symbol}, giving up")
+        return None
+    except SymbolNotFound:
+        raise
     except Exception as e:
         logger.error(f"Finnhub API call failed for {symbol}: {e}")
         return None
     
-def chunk_text(text: str, max_input_tokens: int = 10000) -> list[str]:
-    """
-    Splits text into chunks safe for Groq API.
-    Leaves room for output tokens.
-    """
-    max_length = max_input_tokens * 4  # ~40,000 chars
-    chunks, current = [], []
-    
-
-    for line in text.splitlines():
-        if sum(len(c) for c in current) + len(line) > max_length:
-            chunks.append("\n".join(current))
-            current = []
-        current.append(line)
-
-    if current:
-        chunks.append("\n".join(current))
-
-    return chunks
-
 def remove_code_blocks(text: str) -> str:
     """
     Removes code blocks and inline code from text.